@@ -0,0 +1,36 @@
+# explain_overhead.py
+# Per-rebalance cost of target_weights with and without the explain dicts.
+# Run from the repo root:  python -m benchmarks.explain_overhead [--assets 3] [--reps 50]
+import argparse, time
+import numpy as np
+
+from benchmarks.synthetic import synthetic_ohlcv
+from engine.engine import Plan, target_weights
+from engine.indicators import cache_clear
+
+def _plan(assets) -> Plan:
+    return Plan(regime="auto", direction_bias="neutral", universe=list(assets), gates={"sentiment":"AUTO"},
+                custom_rules=[], weighting={}, rebalance={"cadence":"weekly"}, risk={}, execution={},
+                sentiment_cfg={})
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--assets", type=int, default=3)
+    ap.add_argument("--reps", type=int, default=50)
+    args = ap.parse_args()
+    ohlcv = {f"A{i}": synthetic_ohlcv(250, seed=i, start="2024-01-01") for i in range(args.assets)}
+    plan = _plan(ohlcv)
+    res = {}
+    for explain in (True, False):
+        times = []
+        for _ in range(args.reps):
+            cache_clear()            # one rebalance = one fresh window, no warm cache
+            t0 = time.perf_counter()
+            target_weights(plan, ohlcv, {}, explain=explain)
+            times.append(time.perf_counter() - t0)
+        res[explain] = float(np.median(times))
+        print(f"explain={explain!s:5}  median {res[explain]*1e3:8.2f} ms / rebalance")
+    print(f"saved {(res[True]-res[False])*1e3:.2f} ms per rebalance ({1-res[False]/res[True]:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# run.py
+# Engine benchmark suite on synthetic OHLCV (benchmarks/synthetic.py), fully offline.
+# For each case: wall time over --repeat runs (min / median), then one extra run under
+# tracemalloc for peak traced memory. Results go to JSON tagged with the git commit,
+# so two commits can be compared with --compare.
+#
+#   python -m benchmarks.run                                  # 1k/10k/100k bars x 3/50/500 assets
+#   python -m benchmarks.run --bars 1000 --assets 3,50 --only indicators,target_weights
+#   python -m benchmarks.run --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+#
+# Cases whose bars*assets exceed --max-cells are recorded as skipped (the full
+# 100k x 500 grid needs several GB); raise it to run everything.
+from __future__ import annotations
+import argparse, functools, gc, json, os, platform, statistics, subprocess, sys, time, tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_ohlcv
+from engine import indicators as I
+from engine.engine import Plan, target_weights
+from engine.panel import to_panel, panel_weights
+from engine.backtest import run_backtest
+
+FREQ = "1h"          # hourly bars keep 100k-bar indexes inside pandas' timestamp range
+WINDOW = 250         # rebalance window used by the backtest
+
+SUITES = ("indicators", "target_weights", "backtest", "scan")
+
+# ---------- Fixtures ----------
+@functools.lru_cache(maxsize=None)
+def _asset(i: int, bars: int) -> pd.DataFrame:
+    return synthetic_ohlcv(bars, seed=i, freq=FREQ)
+
+def universe(assets: int, bars: int) -> Dict[str,pd.DataFrame]:
+    return {f"A{i:03d}": _asset(i, bars) for i in range(assets)}
+
+def bench_plan(assets) -> Plan:
+    return Plan(regime="auto", direction_bias="neutral", universe=list(assets), gates={"sentiment":"AUTO"},
+                custom_rules=[], weighting={}, rebalance={"cadence":"weekly"}, risk={}, execution={},
+                sentiment_cfg={})
+
+# ---------- Measurement ----------
+def measure(fn: Callable[[], object], repeat: int, setup: Callable[[], None] = I.cache_clear) -> dict:
+    times = []
+    for _ in range(repeat):
+        setup(); gc.collect()
+        t = time.perf_counter(); fn(); times.append(time.perf_counter() - t)
+    setup(); gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"repeat": repeat, "min_s": min(times), "median_s": statistics.median(times),
+            "peak_mb": peak / 2**20}
+
+# ---------- Cases ----------
+def _indicator_calls(df: pd.DataFrame) -> Dict[str,Callable[[], object]]:
+    h, l, c, v = df["high"], df["low"], df["close"], df["volume"]
+    return {
+        "sma": lambda: I.sma(c, 50), "ema": lambda: I.ema(c, 50), "atr": lambda: I.atr(h, l, c),
+        "rsi": lambda: I.rsi(c), "stoch_rsi": lambda: I.stoch_rsi(c), "macd": lambda: I.macd(c),
+        "adx": lambda: I.adx(h, l, c), "donchian_high": lambda: I.donchian_high(h),
+        "bollinger": lambda: I.bollinger(c), "keltner": lambda: I.keltner(h, l, c),
+        "squeeze_bb_kc": lambda: I.squeeze_bb_kc(c, h, l), "vwap": lambda: I.vwap(c, v),
+        "obv": lambda: I.obv(c, v), "cmf": lambda: I.cmf(h, l, c, v), "mfi": lambda: I.mfi(h, l, c, v),
+        "support_levels": lambda: I.support_levels(h, l, c),
+        "volume_profile": lambda: I.volume_profile(c, v),
+    }
+
+def indicator_cases(bars: int, assets: int):
+    if assets != 1: return        # per-series functions: one asset per bar count
+    for name, fn in _indicator_calls(_asset(0, bars)).items():
+        yield f"indicators.{name}", fn
+
+def target_weights_cases(bars: int, assets: int):
+    # one rebalance: the last WINDOW bars of every asset, as the backtest passes them
+    if bars != min(BARS): return
+    ohlcv = {a: df.iloc[-WINDOW:] for a, df in universe(assets, max(bars, WINDOW)).items()}
+    plan = bench_plan(ohlcv)
+    yield "engine.target_weights", lambda: target_weights(plan, ohlcv, {}, explain=False)
+    yield "engine.target_weights[explain]", lambda: target_weights(plan, ohlcv, {}, explain=True)
+    frame = to_panel(ohlcv)
+    yield "panel.panel_weights", lambda: panel_weights(plan, frame, {})
+
+def backtest_cases(bars: int, assets: int):
+    ohlcv = universe(assets, bars)
+    plan = bench_plan(ohlcv)
+    yield "backtest.run_backtest[vectorized]", lambda: run_backtest(plan, ohlcv, {}, vectorized=True)
+    if bars * assets <= LOOP_CELLS:
+        yield "backtest.run_backtest[loop]", lambda: run_backtest(plan, ohlcv, {})
+
+def scan_cases(bars: int, assets: int):
+    try:
+        from trade_patterns.signals import scanner
+    except ImportError as e:            # scanner imports the ccxt loader at module level
+        yield "scanner.scan", SkipCase(f"trade_patterns unavailable: {e}")
+        return
+    ohlcv = universe(assets, bars)
+    def offline_load(symbols, timeframe="1h", bars=720, exchange_id=None):
+        return {s: ohlcv[s].iloc[-bars:] for s in symbols}
+    def run():
+        real, scanner.load_many = scanner.load_many, offline_load
+        try:
+            return scanner.scan(list(ohlcv), FREQ, list(scanner.DETECTORS), bars=bars, limit=50)
+        finally:
+            scanner.load_many = real
+    yield "scanner.scan", run
+
+class SkipCase(str):
+    pass
+
+CASES = {"indicators": indicator_cases, "target_weights": target_weights_cases,
+         "backtest": backtest_cases, "scan": scan_cases}
+
+BARS: List[int] = [1_000, 10_000, 100_000]
+ASSETS: List[int] = [3, 50, 500]
+LOOP_CELLS = 30_000
+
+def run_suite(suites, bars_list, assets_list, repeat: int, max_cells: int, log=print) -> List[dict]:
+    results = []
+    for bars in bars_list:
+        for assets in ([1] if "indicators" in suites else []) + list(assets_list):
+            for suite in suites:
+                if (suite == "indicators") != (assets == 1): continue
+                if bars * assets > max_cells:
+                    results.append({"suite": suite, "bars": bars, "assets": assets,
+                                    "skipped": f"bars*assets > max_cells ({max_cells})"})
+                    continue
+                for name, fn in CASES[suite](bars, assets):
+                    row = {"suite": suite, "case": name, "bars": bars, "assets": assets}
+                    if isinstance(fn, SkipCase):
+                        row["skipped"] = str(fn)
+                    else:
+                        row.update(measure(fn, repeat))
+                        log(f"{name:40} bars={bars:<7} assets={assets:<4} "
+                            f"median {row['median_s']*1e3:10.2f} ms  peak {row['peak_mb']:8.1f} MB")
+                    results.append(row)
+        _asset.cache_clear()
+    return results
+
+# ---------- Output ----------
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def meta() -> dict:
+    return {"commit": git_commit(), "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "freq": FREQ}
+
+def _key(r: dict) -> tuple:
+    return (r.get("case", r["suite"]), r["bars"], r["assets"])
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f: old = {_key(r): r for r in json.load(f)["results"] if "median_s" in r}
+    with open(new_path) as f: new = {_key(r): r for r in json.load(f)["results"] if "median_s" in r}
+    print(f"{'case':40} {'bars':>7} {'assets':>6} {'old ms':>10} {'new ms':>10} {'x':>6} {'peak MB old/new':>18}")
+    for k in sorted(old.keys() & new.keys()):
+        o, n = old[k], new[k]
+        print(f"{k[0]:40} {k[1]:>7} {k[2]:>6} {o['median_s']*1e3:10.2f} {n['median_s']*1e3:10.2f} "
+              f"{o['median_s']/max(n['median_s'], 1e-12):6.2f} {o['peak_mb']:8.1f}/{n['peak_mb']:<8.1f}")
+
+def _ints(s: str) -> List[int]:
+    return [int(float(x)) for x in s.split(",") if x]
+
+def main(argv=None):
+    global BARS, ASSETS, LOOP_CELLS
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--bars", default=",".join(map(str, BARS)))
+    ap.add_argument("--assets", default=",".join(map(str, ASSETS)))
+    ap.add_argument("--only", default=",".join(SUITES), help=f"subset of {','.join(SUITES)}")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--max-cells", type=float, default=5e6, help="skip cases with bars*assets above this")
+    ap.add_argument("--loop-cells", type=float, default=LOOP_CELLS,
+                    help="largest bars*assets also run through the bar-by-bar backtest")
+    ap.add_argument("--out", default=None, help="JSON path (default benchmarks/results/<commit>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = ap.parse_args(argv)
+    if args.compare:
+        compare(*args.compare); return
+    suites = [s for s in args.only.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown: ap.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    BARS, ASSETS, LOOP_CELLS = _ints(args.bars), _ints(args.assets), int(args.loop_cells)
+    info = meta()
+    results = run_suite(suites, BARS, ASSETS, args.repeat, int(args.max_cells))
+    out = args.out or os.path.join("benchmarks", "results", f"{(info['commit'] or 'nocommit')[:12]}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": info | {"bars": BARS, "assets": ASSETS, "repeat": args.repeat}, "results": results},
+                  f, indent=2)
+    print(f"wrote {len(results)} results to {out}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# synthetic.py
+# Deterministic OHLCV fixtures for benchmarks: seeded random walks that cycle
+# through trend / range / breakout segments so every code path (regime vote,
+# breakout scoring, pattern detectors) gets exercised. Same seed, same frame.
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+REGIMES = ("trend_up", "range", "breakout", "trend_down")
+
+def synthetic_ohlcv(bars: int = 1000, seed: int = 0, freq: str = "1D", start: str = "2020-01-01",
+                    price: float = 100.0, vol: float = 0.02, segment: int = 120) -> pd.DataFrame:
+    """One asset: `bars` candles at `freq`, regimes switching every ~`segment` bars."""
+    rng = np.random.default_rng(seed)
+    n_seg = -(-bars // segment)
+    kinds = rng.integers(0, len(REGIMES), n_seg)
+    r = vol * rng.standard_normal(bars)
+    vmult = np.ones(bars)
+    logp = np.empty(bars); level = np.log(price)
+    for k, kind in enumerate(kinds):
+        a, b = k*segment, min((k+1)*segment, bars)
+        name = REGIMES[kind]
+        if name.startswith("trend") and abs(level - np.log(price)) > 1.5:   # keep long runs bounded
+            name = "trend_down" if level > np.log(price) else "trend_up"
+        if name == "trend_up":     r[a:b] += vol * 0.25
+        elif name == "trend_down": r[a:b] -= vol * 0.25
+        elif name == "range":      r[a:b] *= 0.5
+        else:                      # quiet base, then a high-volume break out of it
+            mid = a + (b - a)*2//3
+            r[a:mid] *= 0.4
+            r[mid:b] += vol * 0.6; vmult[mid:b] = 2.5
+        if name == "range":        # mean-revert to the segment's opening level
+            anchor = level
+            for i in range(a, b):
+                level += r[i] - 0.1*(level - anchor); logp[i] = level
+        else:
+            logp[a:b] = level + np.cumsum(r[a:b]); level = logp[b-1]
+    close = np.exp(logp)
+    open_ = np.concatenate([[price], close[:-1]])
+    wick = np.abs(vol * 0.5 * rng.standard_normal((2, bars)))
+    high = np.maximum(open_, close) * np.exp(wick[0])
+    low = np.minimum(open_, close) * np.exp(-wick[1])
+    volume = np.exp(10 + 0.4*rng.standard_normal(bars)) * vmult
+    idx = pd.date_range(start, periods=bars, freq=freq, tz="UTC")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume}, index=idx)
+
+def synthetic_universe(assets: int = 3, bars: int = 1000, seed: int = 0, freq: str = "1D") -> dict[str, pd.DataFrame]:
+    """`assets` independent series on a shared index, named A000, A001, ..."""
+    return {f"A{i:03d}": synthetic_ohlcv(bars, seed*100_003 + i, freq) for i in range(assets)}
+
+def synthetic_sentiment(ohlcv: dict[str, pd.DataFrame], seed: int = 0) -> dict[str, pd.Series]:
+    rng = np.random.default_rng(seed)
+    return {a: pd.Series(np.clip(rng.normal(0.1, 0.3, len(df)), -1, 1), index=df.index)
+            for a, df in ohlcv.items()}
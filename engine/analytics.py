@@ -0,0 +1,78 @@
+# analytics.py
+# Performance statistics from equity arrays in one NumPy pass. Every function works
+# on a single curve (T,) or a stack of curves (paths x T) along the last axis, so
+# backtests, sweeps and Monte Carlo paths share the same code. A 1-D input gives
+# floats, a 2-D input gives one array per statistic.
+#
+# Definitions (periods = bars per year, 365 for daily crypto bars):
+#   Vol        std(r, ddof=1) * sqrt(periods)
+#   Sharpe     mean(r) * periods / Vol
+#   Sortino    mean(r) * periods / (sqrt(mean(min(r, 0)**2)) * sqrt(periods))
+#   Calmar     CAGR_est / |MaxDD|
+#   MaxDDDuration / CurrentDDDuration   bars spent below the running peak
+#   HitRate    share of bars with r > 0 among bars with r != 0
+#   Exposure   mean invested fraction of equity (needs exposure per bar)
+#   Turnover   annualised traded notional / equity (needs traded fraction per bar)
+from __future__ import annotations
+import numpy as np
+
+def returns(equity) -> np.ndarray:
+    e = np.asarray(equity, dtype=float)
+    return e[..., 1:] / e[..., :-1] - 1
+
+def drawdown(equity) -> np.ndarray:
+    e = np.asarray(equity, dtype=float)
+    return e / np.maximum.accumulate(e, axis=-1) - 1
+
+def _underwater_runs(dd: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # length of the current below-peak streak at every bar, via the last bar at a peak
+    T = dd.shape[-1]
+    pos = np.arange(T)
+    last_peak = np.maximum.accumulate(np.where(dd >= 0, pos, -1), axis=-1)
+    run = pos - last_peak
+    return run.max(axis=-1), run[..., -1]
+
+def rolling_sharpe(equity, window: int = 90, periods: int = 365) -> np.ndarray:
+    """Sharpe over each trailing `window` returns (NaN until the window is full)."""
+    r = returns(equity)
+    cs = np.cumsum(r, axis=-1); cs2 = np.cumsum(r*r, axis=-1)
+    pad = np.zeros(r.shape[:-1] + (1,))
+    cs = np.concatenate([pad, cs], axis=-1); cs2 = np.concatenate([pad, cs2], axis=-1)
+    out = np.full(r.shape, np.nan)
+    if window < 2 or r.shape[-1] < window: return out
+    s1 = cs[..., window:] - cs[..., :-window]
+    s2 = cs2[..., window:] - cs2[..., :-window]
+    mean = s1 / window
+    var = np.maximum(s2 - window*mean*mean, 0.0) / (window - 1)
+    out[..., window-1:] = mean*periods / (np.sqrt(var*periods) + 1e-9)
+    return out
+
+def performance(equity, periods: int = 365, exposure=None, traded=None) -> dict:
+    """The run_backtest stats plus Sortino, Calmar, drawdown durations, hit rate and,
+    when per-bar exposure / traded fractions are given, Exposure and Turnover."""
+    e = np.asarray(equity, dtype=float)
+    r = returns(e)
+    n = e.shape[-1]
+    total = e[..., -1] / e[..., 0] - 1
+    mean = r.mean(axis=-1)
+    vol = r.std(axis=-1, ddof=1) * periods**0.5
+    down = np.sqrt((np.minimum(r, 0.0)**2).mean(axis=-1)) * periods**0.5
+    dd = drawdown(e)
+    max_dd = dd.min(axis=-1)
+    cagr = (1 + total)**(periods/n) - 1
+    dd_max_len, dd_cur_len = _underwater_runs(dd)
+    ups, moves = (r > 0).sum(axis=-1), (r != 0).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = {"TotalReturn": total, "CAGR_est": cagr, "MaxDD": max_dd, "Vol": vol,
+               "Sharpe": mean*periods / (vol + 1e-9),
+               "Sortino": mean*periods / (down + 1e-9),
+               "Calmar": np.where(max_dd < 0, cagr / np.abs(max_dd), np.nan),
+               "MaxDDDuration": dd_max_len, "CurrentDDDuration": dd_cur_len,
+               "HitRate": np.where(moves > 0, ups / np.maximum(moves, 1), np.nan)}
+    if exposure is not None:
+        out["Exposure"] = np.nanmean(np.asarray(exposure, dtype=float), axis=-1)
+    if traded is not None:
+        out["Turnover"] = np.nansum(np.asarray(traded, dtype=float), axis=-1) * periods / n
+    if e.ndim == 1:
+        return {k: (int(v) if k.endswith("Duration") else float(v)) for k, v in out.items()}
+    return out
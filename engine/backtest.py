@@ -51,12 +51,107 @@
 
 
 
+import numpy as np
 import pandas as pd
-from typing import Dict, Tuple
-from engine.engine import Plan, target_weights, build_trade_plan
+from dataclasses import dataclass
+from typing import Dict, List
+from engine.analytics import performance
+from engine.profiling import stage
+from engine.engine import Plan, target_weights, build_trade_plan, regime_series, template_at
+
+class Ledger:
+    """Portfolio state on preallocated arrays: aligned closes (bars x assets), a
+    holdings vector, cash, equity/exposure/traded buffers and a columnar trade log."""
+
+    def __init__(self, assets, idx: pd.DatetimeIndex, close: np.ndarray, cash: float = 1_000_000.0):
+        self.assets = list(assets)
+        self.col = {a: k for k, a in enumerate(self.assets)}
+        self.idx = idx
+        self.close = close
+        self.holdings = np.zeros(len(self.assets))
+        self.cash = cash
+        self.equity = np.full(len(idx), np.nan)
+        self.exposure = np.full(len(idx), np.nan)     # invested / equity at the bar's close
+        self.traded = np.zeros(len(idx))               # gross usd filled at the bar
+        self.log = {"bar": [], "asset": [], "units": [], "usd": []}
+
+    @classmethod
+    def from_ohlcv(cls, ohlcv: Dict[str,pd.DataFrame], idx: pd.DatetimeIndex, cash: float = 1_000_000.0) -> "Ledger":
+        close = np.column_stack([ohlcv[a]["close"].reindex(idx).to_numpy(dtype=float) for a in ohlcv])
+        return cls(ohlcv, idx, close, cash)
+
+    def mark(self, i: int) -> float:
+        invested = float(self.holdings @ self.close[i])
+        port = self.cash + invested
+        self.equity[i] = port
+        self.exposure[i] = invested / port if port > 0 else 0.0
+        return port
+
+    def weights(self, i: int, port: float) -> Dict[str,float]:
+        w = self.holdings * self.close[i] / port if port > 0 else np.zeros(len(self.assets))
+        return dict(zip(self.assets, w.tolist()))
+
+    def execute(self, i: int, dollars: Dict[str,float], scale: float = 1.0):
+        """Fill the dollar orders at bar i's close; buys need cash, sells are capped at the position."""
+        px = self.close[i]
+        for a, d in dollars.items():
+            k = self.col[a]; d *= scale
+            if d > 0 and self.cash >= d:
+                units = d/(px[k]+1e-9); self.holdings[k] += units; self.cash -= d
+            elif d < 0:
+                sell = min(-d, self.holdings[k]*px[k]); units = -sell/(px[k]+1e-9)
+                self.holdings[k] += units; self.cash += sell; d = -sell
+            else:
+                continue
+            self.traded[i] += abs(d)
+            log = self.log
+            log["bar"].append(i); log["asset"].append(k); log["units"].append(units); log["usd"].append(d)
+
+    def curve(self) -> pd.DataFrame:
+        """equity plus exposure and turnover (traded usd / equity) per bar."""
+        return pd.DataFrame({"equity": self.equity, "exposure": self.exposure, "turnover": self.traded / self.equity},
+                            index=self.idx.rename("time"))
+
+    def trades(self) -> pd.DataFrame:
+        """One row per fill: time, asset, signed units and signed usd (buys positive)."""
+        log = self.log
+        return pd.DataFrame({"time": self.idx[np.asarray(log["bar"], dtype=int)],
+                             "asset": np.asarray(self.assets, dtype=object)[np.asarray(log["asset"], dtype=int)],
+                             "units": np.asarray(log["units"], dtype=float),
+                             "usd": np.asarray(log["usd"], dtype=float)})
+
+WINDOW = 250   # bars scored per rebalance (engine.vectorized.WINDOW)
+
+@dataclass
+class BacktestState:
+    """Everything extend_backtest needs to continue a run: the book, the curve so far,
+    and the bars/sentiment that future rebalance windows can still reach."""
+    plan: Plan
+    first_bar: pd.Timestamp          # anchors the weekly/monthly schedule
+    last_bar: pd.Timestamp
+    last_rebalance: pd.Timestamp | None
+    assets: List[str]
+    holdings: np.ndarray
+    cash: float
+    equity: pd.DataFrame
+    trades: pd.DataFrame
+    bars: Dict[str,pd.DataFrame]      # last WINDOW bars per asset (full history with regime_by_date)
+    sentiment: Dict[str,pd.Series]   # from the last value at or before last_bar onwards
+    vectorized: bool = False
+    regime_by_date: bool = False
 
 def run_backtest(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
-                 start=None, end=None) -> Tuple[pd.DataFrame, dict]:
+                 start=None, end=None, vectorized: bool = False, panels=None,
+                 rebalance_dates=None, regime_by_date: bool = False, return_state: bool = False):
+    """Simulate the plan bar by bar. vectorized=True reads rebalance scores from
+    indicator panels precomputed once per asset (engine.vectorized) instead of
+    rescoring a 250-bar window with target_weights on every rebalance date.
+    panels: prebuilt engine.vectorized.build_panels(ohlcv) to reuse across runs.
+    rebalance_dates: explicit schedule overriding plan.rebalance["cadence"].
+    regime_by_date: pick the template per date from whole-history regime labels
+    (engine.regime_series) instead of classifying every rebalance window.
+    return_state=True returns (ec, stats, BacktestState) for extend_backtest; the
+    fills are on state.trades (see Ledger.trades)."""
     # Align index across assets
     idx = None
     for df in ohlcv.values():
@@ -64,53 +159,106 @@ def run_backtest(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,
     if start: idx = idx[idx >= pd.to_datetime(start, utc=True)]
     if end:   idx = idx[idx <= pd.to_datetime(end, utc=True)]
     if idx is None or len(idx) < 60:
-        return pd.DataFrame(columns=["equity"]), {"error":"not enough data"}
+        ec, stats = pd.DataFrame(columns=["equity"]), {"error":"not enough data"}
+        return (ec, stats, None) if return_state else (ec, stats)
 
-    cadence = plan.rebalance.get("cadence","weekly")
-    if cadence=="weekly":
-        rb_dates = pd.date_range(idx[0], idx[-1], freq="W-FRI")
-    elif cadence=="daily":
-        rb_dates = idx
-    else:
-        rb_dates = pd.date_range(idx[0], idx[-1], freq="M")
+    rb_dates = pd.DatetimeIndex(rebalance_dates) if rebalance_dates is not None else rebalance_schedule(plan, idx)
+    ledger = Ledger.from_ohlcv(ohlcv, idx)
+    last_rb = _simulate(plan, ohlcv, sentiment, ledger, idx.isin(rb_dates), vectorized, panels, regime_by_date)
+
+    ec = ledger.curve()
+    if not return_state:
+        return ec, equity_stats(ec)
+    state = _snapshot(plan, ohlcv, sentiment, ledger, ec, ledger.trades(), idx[0], last_rb, vectorized, regime_by_date)
+    return ec, equity_stats(ec), state
 
-    value = 1_000_000.0; cash = value; holdings = {a:0.0 for a in ohlcv}
+def extend_backtest(state: BacktestState, new_bars: Dict[str,pd.DataFrame],
+                    new_sentiment: Dict[str,pd.Series] | None = None):
+    """Continue a run_backtest(..., return_state=True) over bars after state.last_bar.
+    new_bars must hold every bar after state.last_bar (overlap is ignored); the result
+    equals a full rerun on the combined history. Returns (ec, stats, new_state)."""
+    ohlcv = {a: _append(state.bars[a], new_bars.get(a)) for a in state.assets}
+    sentiment = dict(state.sentiment)
+    for a, s in (new_sentiment or {}).items():
+        sentiment[a] = _append(sentiment.get(a), s)
+    idx = None
+    for df in ohlcv.values():
+        idx = df.index if idx is None else idx.intersection(df.index)
+    idx = idx[idx > state.last_bar]
+    if not len(idx):
+        return state.equity, equity_stats(state.equity), state
+
+    plan = state.plan
+    rb_dates = rebalance_schedule(plan, idx.insert(0, state.first_bar))
+    ledger = Ledger.from_ohlcv(ohlcv, idx, state.cash)
+    ledger.holdings[:] = state.holdings
+    last_rb = _simulate(plan, ohlcv, sentiment, ledger, idx.isin(rb_dates), state.vectorized, None,
+                        state.regime_by_date) or state.last_rebalance
+
+    ec = pd.concat([state.equity, ledger.curve()])
+    trades = pd.concat([state.trades, ledger.trades()], ignore_index=True)
+    new_state = _snapshot(plan, ohlcv, sentiment, ledger, ec, trades, state.first_bar, last_rb,
+                          state.vectorized, state.regime_by_date)
+    return ec, equity_stats(ec), new_state
+
+def _simulate(plan, ohlcv, sentiment, ledger: Ledger, is_rb: np.ndarray, vectorized: bool, panels,
+              regime_by_date: bool):
     band_pp = plan.rebalance.get("band_pp", 5.0)
     turn_cap = plan.rebalance.get("turnover_max", 0.15)
 
-    def weights_now(prices):
-        port = cash + sum(holdings[a]*prices[a] for a in ohlcv)
-        return {a: (holdings[a]*prices[a])/port if port>0 else 0.0 for a in ohlcv}
-
-    curve = []
-    for t in idx:
-        px = {a: ohlcv[a].loc[t,"close"] for a in ohlcv}
-        port = cash + sum(holdings[a]*px[a] for a in ohlcv)
-        curve.append((t, port))
-
-        if t in rb_dates:
-            tw, _ = target_weights(plan, {a: ohlcv[a].loc[:t].iloc[-250:] for a in ohlcv},
-                                   {a: (sentiment.get(a).loc[:t] if a in sentiment else None) for a in ohlcv})
-            if not tw: continue
-            cw = weights_now(px)
-            dollars = build_trade_plan(cw, tw, port, band_pp)
-            turnover = sum(abs(v) for v in dollars.values())
-            scale = min(1.0, (turn_cap*port/turnover) if turnover>0 else 0.0)
-            for a, d in dollars.items():
-                d *= scale
-                if d > 0 and cash >= d:
-                    units = d/(px[a]+1e-9); holdings[a]+=units; cash-=d
-                elif d < 0:
-                    sell = min(-d, holdings[a]*px[a]); units = sell/(px[a]+1e-9)
-                    holdings[a]-=units; cash+=sell
-
-    ec = pd.DataFrame(curve, columns=["time","equity"]).set_index("time")
-    ret = ec["equity"].iloc[-1]/ec["equity"].iloc[0]-1
-    vol = ec["equity"].pct_change().std()*365**0.5
-    dd = (ec["equity"]/ec["equity"].cummax()-1).min()
-    sharpe = (ec["equity"].pct_change().mean()*365) / (vol+1e-9)
-    stats = {"TotalReturn": float(ret),
-             "CAGR_est": float((1+ret)**(365/len(ec))-1),
-             "MaxDD": float(dd), "Vol": float(vol), "Sharpe": float(sharpe)}
-    return ec, stats
+    with stage("indicators"):
+        regimes = regime_series(ohlcv) if regime_by_date and plan.regime == "auto" else None
+    weigh = None
+    if vectorized:
+        from engine.vectorized import VectorizedWeights
+        with stage("indicators"):
+            weigh = VectorizedWeights(plan, ohlcv, sentiment, window=WINDOW, panels=panels, regimes=regimes)
+
+    last_rb = None
+    with stage("ledger_loop"):
+        for i, t in enumerate(ledger.idx):
+            port = ledger.mark(i)
+            if is_rb[i]:
+                last_rb = t
+                with stage("target_weights"):
+                    if weigh is not None:
+                        tw = weigh(t)
+                    else:
+                        tw, _ = target_weights(plan, {a: ohlcv[a].loc[:t].iloc[-WINDOW:] for a in ohlcv},
+                                               {a: (sentiment.get(a).loc[:t] if a in sentiment else None) for a in ohlcv}, explain=False,
+                                               template=template_at(plan, regimes, t) if regimes is not None else None)
+                if not tw: continue
+                dollars = build_trade_plan(ledger.weights(i, port), tw, port, band_pp)
+                turnover = sum(abs(v) for v in dollars.values())
+                scale = min(1.0, (turn_cap*port/turnover) if turnover>0 else 0.0)
+                ledger.execute(i, dollars, scale)
+    return last_rb
+
+def _append(old, new):
+    if old is None: return new
+    if new is None or not len(new): return old
+    return pd.concat([old, new[new.index > old.index[-1]]]) if len(old) else new
+
+def _snapshot(plan, ohlcv, sentiment, ledger: Ledger, ec, trades, first_bar, last_rb,
+              vectorized, regime_by_date) -> BacktestState:
+    t = ledger.idx[-1]
+    # windows after t reach back at most WINDOW-1 bars; the expanding regime quantile needs everything
+    bars = {a: (df.loc[:t] if regime_by_date else df.loc[:t].iloc[-WINDOW:]) for a, df in ohlcv.items()}
+    sent = {}
+    for a, s in sentiment.items():
+        if s is None: continue
+        k = int(s.index.searchsorted(t, side="right"))
+        sent[a] = s.iloc[max(k-1, 0):]
+    return BacktestState(plan, first_bar, t, last_rb, list(ohlcv), ledger.holdings.copy(), float(ledger.cash),
+                         ec, trades, bars, sent, vectorized, regime_by_date)
+
+def rebalance_schedule(plan: Plan, idx: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    cadence = plan.rebalance.get("cadence","weekly")
+    if cadence=="weekly":
+        return pd.date_range(idx[0], idx[-1], freq="W-FRI")
+    elif cadence=="daily":
+        return idx
+    return pd.date_range(idx[0], idx[-1], freq="ME")
 
+def equity_stats(ec: pd.DataFrame) -> dict:
+    return performance(ec["equity"].to_numpy(dtype=float), exposure=ec.get("exposure"), traded=ec.get("turnover"))
@@ -158,17 +158,19 @@
 
 # engine.py
 from __future__ import annotations
-import math, re
+import functools, math, re
 from dataclasses import dataclass
 from typing import Dict, List, Tuple
+import numpy as np
 import pandas as pd
 
 from engine.indicators import (
     sma, ema, rsi, stoch_rsi, macd, atr, adx, di_plus_minus,
     donchian_high, donchian_low, bollinger, keltner, squeeze_bb_kc,
-    vwap, obv, cmf, mfi, support_levels, volume_profile_nodes, rsi_divergence
+    vwap, obv, cmf, mfi, support_levels, volume_profile_nodes, rsi_divergence,
+    ema_window, rsi_window
 )
-from services.planner.regime import classify_regime, map_regime_to_template
+from services.planner.regime import classify_regime, classify_regime_series, map_regime_to_template
 
 # ---------- Plan dataclass ----------
 @dataclass
@@ -184,6 +186,22 @@ class Plan:
     execution: dict
     sentiment_cfg: dict
 
+    @classmethod
+    def from_dict(cls, pj: dict) -> "Plan":
+        """Build from plan JSON as produced by the planner (universe under universe_list)."""
+        return cls(
+            regime=pj["regime"],
+            direction_bias=pj.get("direction_bias", "neutral"),
+            universe=pj["universe_list"],
+            gates=pj["gates"],
+            custom_rules=pj.get("custom_rules", []),
+            weighting=pj["weighting"],
+            rebalance=pj["rebalance"],
+            risk=pj["risk"],
+            execution=pj["execution"],
+            sentiment_cfg=pj.get("sentiment_cfg", {}),
+        )
+
 # ---------- Helpers ----------
 def _sent_val(s_series: pd.Series | None) -> float:
     if s_series is None or s_series.empty: return 0.0
@@ -193,80 +211,139 @@ def _bool_adx_rising(adx_series: pd.Series) -> bool:
     return (adx_series.diff().tail(5) > 0).sum() >= 3
 
 # ---------- Rule parser (custom_rules) ----------
+# Each rule maps to a function returning a boolean Series over the whole frame. With
+# window=N the EMA/RSI underneath are evaluated as of a trailing N-bar window at every
+# bar, i.e. the value check_custom_rules would see on df.iloc[j-N+1:j+1].
+def _rolling_rule(sig, n: int, window: int | None):
+    # a rolling mean over n bars is the same on any trailing window that holds n bars;
+    # a shorter window only ever sees NaN, so the rule is False throughout
+    return sig & False if window is not None and n > window else sig
+
 _RULES = [
-    (re.compile(r"CLOSE\s*>\s*SMA\((\d+)\)", re.I), lambda df,m: df["close"].iloc[-1] > sma(df["close"], int(m)).iloc[-1]),
-    (re.compile(r"CLOSE\s*>\s*EMA\((\d+)\)", re.I), lambda df,m: df["close"].iloc[-1] > ema(df["close"], int(m)).iloc[-1]),
-    (re.compile(r"RSI\((\d+)\)\s*>\s*(\d+)", re.I), lambda df,n,t: rsi(df["close"], int(n)).iloc[-1] > int(t)),
-    (re.compile(r"RSI\((\d+)\)\s*<\s*(\d+)", re.I), lambda df,n,t: rsi(df["close"], int(n)).iloc[-1] < int(t)),
+    (re.compile(r"CLOSE\s*>\s*SMA\((\d+)\)", re.I),
+        lambda df,m,w: _rolling_rule(df["close"] > sma(df["close"], int(m)), int(m), w)),
+    (re.compile(r"CLOSE\s*>\s*EMA\((\d+)\)", re.I), lambda df,m,w: df["close"] > ema_window(df["close"], int(m), w)),
+    (re.compile(r"RSI\((\d+)\)\s*>\s*(\d+)", re.I), lambda df,n,t,w: rsi_window(df["close"], int(n), w) > int(t)),
+    (re.compile(r"RSI\((\d+)\)\s*<\s*(\d+)", re.I), lambda df,n,t,w: rsi_window(df["close"], int(n), w) < int(t)),
     (re.compile(r"VOLUME\s*>\s*([0-9.]+)\*VOL_SMA\((\d+)\)", re.I),
-        lambda df,k,n: df["volume"].iloc[-1] > float(k)*df["volume"].rolling(int(n)).mean().iloc[-1]),
-    (re.compile(r"SENTIMENT\s*>=\s*GOOD", re.I), lambda df: True),
+        lambda df,k,n,w: _rolling_rule(df["volume"] > float(k)*df["volume"].rolling(int(n)).mean(), int(n), w)),
+    (re.compile(r"SENTIMENT\s*>=\s*GOOD", re.I), lambda df,w: pd.Series(True, index=df.index)),
 ]
 
-def check_custom_rules(df: pd.DataFrame, rules: List[str], sentiment_ok: bool) -> bool:
+def _parse_args(groups) -> list:
+    parsed = []
+    for g in groups:
+        try:
+            parsed.append(int(g))
+        except ValueError:
+            parsed.append(float(g))
+    return parsed
+
+@dataclass(frozen=True)
+class CompiledRules:
+    """Plan.custom_rules parsed once: matched clauses plus whether the sentiment gate applies."""
+    clauses: Tuple[tuple, ...]
+    needs_sentiment: bool
+
+    def signal(self, df: pd.DataFrame, sentiment_ok=True, window: int | None = None) -> pd.Series:
+        """Gate state for every bar of df. sentiment_ok may be a bool or a bool Series."""
+        out = pd.Series(True, index=df.index)
+        for fn, args in self.clauses:
+            out &= fn(df, *args, window)
+        if self.needs_sentiment:
+            out &= sentiment_ok
+        return out
+
+    def check(self, df: pd.DataFrame, sentiment_ok: bool) -> bool:
+        """Gate state on the last bar of df."""
+        if self.needs_sentiment and not sentiment_ok: return False
+        for fn, args in self.clauses:
+            if not bool(fn(df, *args, None).iloc[-1]): return False
+        return True
+
+    def check_panel(self, fields: Dict[str,pd.DataFrame], sentiment_ok) -> np.ndarray:
+        """check() for every asset of wide frames (index = time, columns = assets) in one pass."""
+        ok = np.ones(fields["close"].shape[1], dtype=bool)
+        if self.needs_sentiment: ok &= np.asarray(sentiment_ok, dtype=bool)
+        if self.clauses:
+            df = pd.concat(fields, axis=1)                 # df["close"] is the close panel
+            for fn, args in self.clauses:
+                ok &= np.asarray(fn(df, *args, None).iloc[-1], dtype=bool)
+        return ok
+
+@functools.lru_cache(maxsize=256)
+def compile_rules(rules: Tuple[str, ...]) -> CompiledRules:
+    clauses, needs_sentiment = [], False
     for rtxt in rules:
-        ok = None
         for rx, fn in _RULES:
             m = rx.match(rtxt.replace(" ", ""))
             if m:
-                try:
-                    parsed = []
-                    for g in m.groups():
-                        try:
-                            parsed.append(int(g))
-                        except ValueError:
-                            parsed.append(float(g))
-                    ok = fn(df, *parsed)
-                except TypeError:
-                    ok = fn(df, *m.groups())
+                clauses.append((fn, tuple(_parse_args(m.groups()))))
                 break
-        if ok is None and "SENTIMENT" in rtxt.upper():
-            ok = sentiment_ok
-        if ok is False:
-            return False
-    return True
+        else:
+            # unrecognised rules are ignored, except sentiment wording which maps to the sentiment gate
+            if "SENTIMENT" in rtxt.upper():
+                needs_sentiment = True
+    return CompiledRules(tuple(clauses), needs_sentiment)
+
+def check_custom_rules(df: pd.DataFrame, rules: List[str], sentiment_ok: bool) -> bool:
+    return compile_rules(tuple(rules)).check(df, sentiment_ok)
 
 # ---------- Scoring ----------
-def trend_score(df: pd.DataFrame) -> float:
-    c,h,l = df["close"], df["high"], df["low"]
-    adx14 = adx(h,l,c,14).iloc[-1]
-    ema50 = ema(c,50).iloc[-1]; ema200 = ema(c,200).iloc[-1]
-    slope = (ema(c,50).iloc[-1] / (ema(c,50).shift(5).iloc[-1] + 1e-9)) - 1.0
+# The *_from helpers hold the scalar formulas; the per-window scorers below and the
+# precomputed panels in engine.vectorized both feed them.
+def _trend_from(adx14: float, ema50: float, ema200: float, ema50_lag5: float) -> float:
+    slope = (ema50 / (ema50_lag5 + 1e-9)) - 1.0
     t = 0.5*(1 + math.tanh(5*slope))
     a = min(max((adx14-10)/30, 0), 1)
     bias = 0.2 if ema50 > ema200 else 0.0
     return max(0.0, min(1.0, 0.5*t + 0.5*a + bias))
 
+def _momentum_from(n: int, last: float, lag60: float) -> float:
+    if n<60: return 0.0
+    r60 = last/(lag60+1e-9)-1.0
+    return max(0.0, min(1.0, (r60 + 0.5) / 2.0))
+
+def _volume_from(last: float, vs: float) -> float:
+    if vs<=0: return 0.0
+    mult = last/vs
+    return max(0.0, min(1.0, (mult-1.0)/1.5))
+
+def _breakout_from(last: float, dhi: float, a: float) -> float:
+    return max(0.0, min(1.0, (last-dhi)/(a+1e-9)))
+
+def _composite_from(coeffs: dict, sc_trend: float, sc_momo: float, sc_vol: float,
+                    sent_val: float, sc_extra: float) -> float:
+    s = (coeffs.get("trend",0.35)*sc_trend +
+         coeffs.get("momentum",0.35)*sc_momo +
+         coeffs.get("volume",0.15)*sc_vol +
+         coeffs.get("sentiment",0.15)*max(0.0, sent_val) +
+         sc_extra)
+    return max(0.0, min(1.0, s))
+
+def trend_score(df: pd.DataFrame) -> float:
+    c,h,l = df["close"], df["high"], df["low"]
+    ema50 = ema(c,50)
+    return _trend_from(adx(h,l,c,14).iloc[-1], ema50.iloc[-1], ema(c,200).iloc[-1], ema50.shift(5).iloc[-1])
+
 def momentum_score(df: pd.DataFrame) -> float:
     c = df["close"]
     if len(c)<60: return 0.0
-    r60 = c.iloc[-1]/(c.shift(60).iloc[-1]+1e-9)-1.0
-    return max(0.0, min(1.0, (r60 + 0.5) / 2.0))
+    return _momentum_from(len(c), c.iloc[-1], c.shift(60).iloc[-1])
 
 def volume_score(df: pd.DataFrame) -> float:
-    v = df["volume"]; vs = v.rolling(20).mean().iloc[-1]
-    if vs<=0: return 0.0
-    mult = v.iloc[-1]/vs
-    return max(0.0, min(1.0, (mult-1.0)/1.5))
+    v = df["volume"]
+    return _volume_from(v.iloc[-1], v.rolling(20).mean().iloc[-1])
 
 def breakout_score(df: pd.DataFrame) -> float:
     c,h,l = df["close"], df["high"], df["low"]
-    dhi = donchian_high(h,20).iloc[-1]; a = atr(h,l,c,14).iloc[-1]
-    return max(0.0, min(1.0, (c.iloc[-1]-dhi)/(a+1e-9)))
+    return _breakout_from(c.iloc[-1], donchian_high(h,20).iloc[-1], atr(h,l,c,14).iloc[-1])
 
 def composite_score(df: pd.DataFrame, coeffs: dict, sent_val: float, template: str) -> float:
-    sc_trend = trend_score(df)
-    sc_momo  = momentum_score(df)
-    sc_vol   = volume_score(df)
     sc_extra = 0.0
     if template == "breakout_up":
         sc_extra = 0.5*breakout_score(df)
-    s = (coeffs.get("trend",0.35)*sc_trend +
-         coeffs.get("momentum",0.35)*sc_momo +
-         coeffs.get("volume",0.15)*sc_vol +
-         coeffs.get("sentiment",0.15)*max(0.0, sent_val) +
-         sc_extra)
-    return max(0.0, min(1.0, s))
+    return _composite_from(coeffs, trend_score(df), momentum_score(df), volume_score(df), sent_val, sc_extra)
 
 # ---------- Strategy selection (auto) ----------
 def infer_plan_template(plan: Plan, ohlcv: Dict[str,pd.DataFrame]) -> str:
@@ -279,9 +356,29 @@ def infer_plan_template(plan: Plan, ohlcv: Dict[str,pd.DataFrame]) -> str:
     reg = max(votes.items(), key=lambda x:x[1])[0] if votes else "other"
     return map_regime_to_template(reg)
 
+def regime_series(ohlcv: Dict[str,pd.DataFrame], quantile_window: int | None = None) -> Dict[str,pd.Series]:
+    return {a: classify_regime_series(df, quantile_window) for a, df in ohlcv.items()}
+
+def template_at(plan: Plan, regimes: Dict[str,pd.Series], t) -> str:
+    """infer_plan_template as of t, voting with precomputed regime_series labels."""
+    if plan.regime != "auto":
+        return infer_plan_template(plan, {})
+    votes = {}
+    for s in regimes.values():
+        k = int(s.index.searchsorted(t, side="right"))
+        if k == 0: continue
+        r = s.iloc[k-1]
+        votes[r] = votes.get(r,0)+1
+    reg = max(votes.items(), key=lambda x:x[1])[0] if votes else "other"
+    return map_regime_to_template(reg)
+
 # ---------- Weights & Explain ----------
-def target_weights(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series]):
-    template = infer_plan_template(plan, ohlcv)
+def target_weights(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+                   explain: bool = True, template: str | None = None):
+    """Score and cap-normalise the universe. explain=False skips the per-asset explain
+    dicts (divergence, supports, volume profile), which backtests and sweeps discard.
+    template: precomputed plan template (e.g. template_at), skips regime classification."""
+    template = template or infer_plan_template(plan, ohlcv)
     coeffs   = plan.weighting.get("coeffs", {"trend":0.35,"momentum":0.35,"volume":0.15,"sentiment":0.15})
     good     = plan.sentiment_cfg.get("good_threshold", 0.30)
     bad      = plan.sentiment_cfg.get("bad_threshold", -0.30)
@@ -298,67 +395,111 @@ def target_weights(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[st
                 continue  # asset gated out
 
         base = composite_score(df, coeffs, s_val, template)
-
-        # Direction bias
-        if plan.direction_bias == "bullish":
-            base = min(1.0, base * 1.15)
-        elif plan.direction_bias == "bearish":
-            if base < 0.7:
-                base *= 0.25
-            else:
-                base *= 0.5
-
-        # Sentiment tilt
-        tilt = 0.0
-        if s_val >= good: tilt = tilt_pct * min(1.0, s_val)
-        elif s_val <= bad: tilt = -tilt_pct * min(1.0, abs(s_val))
-        score = max(0.0, base * (1 + tilt))
+        score = _tilted_score(plan, base, s_val, good, bad, tilt_pct)
 
         weights[a] = score
 
-        # Explain bullets
-        c,h,l,v = df["close"], df["high"], df["low"], df["volume"]
-        ema50, ema200 = ema(c,50).iloc[-1], ema(c,200).iloc[-1]
-        adx14 = adx(h,l,c,14).iloc[-1]
-        rsi14 = rsi(c,14).iloc[-1]
-        m, bb_u, bb_l, bw, pctb = bollinger(c,20,2)
-        kc_m, kc_u, kc_l = keltner(h,l,c,20,1.5)
-        squeeze = "ON" if ((bb_u.iloc[-1] < kc_u.iloc[-1]) and (bb_l.iloc[-1] > kc_l.iloc[-1])) else "OFF"
-        div = rsi_divergence(c, 100, 5)
-        hvns = volume_profile_nodes(c.tail(180), v.tail(180))
-        sup  = support_levels(h,l,c,180,5,0.75)
-
-        explains[a] = {
-            "template": template,
-            "trend": f"EMA50 {'>' if ema50>ema200 else '<'} EMA200, ADX14={adx14:.1f}",
-            "momentum_60d": f"{(c.iloc[-1]/(c.shift(60).iloc[-1] + 1e-9) - 1.0):.2%}" if len(c)>60 else "n/a",
-            "rsi14": f"{rsi14:.1f}",
-            "bb_bw": f"{bw.iloc[-1]:.3f}", "bb_squeeze": squeeze, "pctB": f"{pctb.iloc[-1]:.2f}",
-            "divergence": div,
-            "hvns": [round(x,2) for x in hvns],
-            "supports": [round(x,2) for x in sup],
-            "sentiment": f"{s_val:+.2f}",
-            "score": f"{score:.3f}"
-        }
-
-    # Normalize with caps
+        if explain:
+            explains[a] = explain_asset(df, template, s_val, score)
+
+    return _cap_weights(plan, weights), explains
+
+def explain_asset(df: pd.DataFrame, template: str, s_val: float, score: float) -> dict:
+    # Explain bullets
+    c,h,l,v = df["close"], df["high"], df["low"], df["volume"]
+    ema50, ema200 = ema(c,50).iloc[-1], ema(c,200).iloc[-1]
+    adx14 = adx(h,l,c,14).iloc[-1]
+    rsi14 = rsi(c,14).iloc[-1]
+    m, bb_u, bb_l, bw, pctb = bollinger(c,20,2)
+    kc_m, kc_u, kc_l = keltner(h,l,c,20,1.5)
+    squeeze = "ON" if ((bb_u.iloc[-1] < kc_u.iloc[-1]) and (bb_l.iloc[-1] > kc_l.iloc[-1])) else "OFF"
+    div = rsi_divergence(c, 100, 5)
+    hvns = volume_profile_nodes(c.tail(180), v.tail(180))
+    sup  = support_levels(h,l,c,180,5,0.75)
+
+    return {
+        "template": template,
+        "trend": f"EMA50 {'>' if ema50>ema200 else '<'} EMA200, ADX14={adx14:.1f}",
+        "momentum_60d": f"{(c.iloc[-1]/(c.shift(60).iloc[-1] + 1e-9) - 1.0):.2%}" if len(c)>60 else "n/a",
+        "rsi14": f"{rsi14:.1f}",
+        "bb_bw": f"{bw.iloc[-1]:.3f}", "bb_squeeze": squeeze, "pctB": f"{pctb.iloc[-1]:.2f}",
+        "divergence": div,
+        "hvns": [round(x,2) for x in hvns],
+        "supports": [round(x,2) for x in sup],
+        "sentiment": f"{s_val:+.2f}",
+        "score": f"{score:.3f}"
+    }
+
+def _tilted_score(plan: Plan, base: float, s_val: float, good: float, bad: float, tilt_pct: float) -> float:
+    # Direction bias
+    if plan.direction_bias == "bullish":
+        base = min(1.0, base * 1.15)
+    elif plan.direction_bias == "bearish":
+        if base < 0.7:
+            base *= 0.25
+        else:
+            base *= 0.5
+
+    # Sentiment tilt
+    tilt = 0.0
+    if s_val >= good: tilt = tilt_pct * min(1.0, s_val)
+    elif s_val <= bad: tilt = -tilt_pct * min(1.0, abs(s_val))
+    return max(0.0, base * (1 + tilt))
+
+def capped_simplex(u, lo=0.0, hi=1.0, total: float = 1.0) -> np.ndarray:
+    """Water-filling: w_i = clip(lam*u_i, lo_i, hi_i) with sum(w) == total, u >= 0.
+
+    f(lam) = sum(clip(lam*u, lo, hi)) is piecewise linear and nondecreasing with
+    breakpoints lo_i/u_i (asset starts filling) and hi_i/u_i (asset is full); sorting
+    them gives lam in O(n log n). Infeasible bounds return lo (sum(lo) >= total) or
+    the fully filled allocation (not enough room under hi) rescaled to total."""
+    u = np.asarray(u, dtype=float)
+    n = len(u)
+    lo = np.broadcast_to(np.asarray(lo, dtype=float), (n,))
+    hi = np.maximum(np.broadcast_to(np.asarray(hi, dtype=float), (n,)), lo)
+    if n == 0: return u.copy()
+    if lo.sum() >= total: return lo * (total / lo.sum()) if lo.sum() > 0 else np.full(n, total/n)
+    pos = u > 0
+    full = np.where(pos, hi, lo)                      # zero-score assets never leave lo
+    if full.sum() <= total: return full * (total / full.sum())
+    up = u[pos]
+    # events: (lam, d_slope, d_const); f(lam) = const + slope*lam between breakpoints
+    lam = np.concatenate([lo[pos]/up, hi[pos]/up])
+    d_slope = np.concatenate([up, -up])
+    d_const = np.concatenate([-lo[pos], hi[pos]])
+    order = np.argsort(lam, kind="stable")
+    lam, d_slope, d_const = lam[order], d_slope[order], d_const[order]
+    slope = np.concatenate([[0.0], np.cumsum(d_slope)])
+    const = lo.sum() + np.concatenate([[0.0], np.cumsum(d_const)])
+    f = const[:-1] + slope[:-1]*lam                   # f at each breakpoint, before its event
+    k = int(np.searchsorted(f, total, side="left"))    # first breakpoint reaching total
+    if k >= len(lam):
+        x = lam[-1]
+    elif slope[k] > 0:
+        x = (total - const[k]) / slope[k]
+    else:
+        x = lam[k]
+    return np.clip(x*u, lo, hi)
+
+def _cap_weights(plan: Plan, weights: Dict[str,float]) -> Dict[str,float]:
+    # Normalize with caps: scores are clipped at max_weight, then scaled
+    # proportionally so that every weight stays within [min, hard_cap] (capped_simplex).
+    # risk["weight_bounds"] = {asset: [min, max]} tightens the bounds per asset.
     if not weights or sum(weights.values())<=0:
-        return {}, explains
+        return {}
     cap  = plan.risk.get("max_weight", 0.40)
     hard = plan.risk.get("hard_cap", 0.50)
-    w = {k: min(v, cap) for k,v in weights.items()}
-    s = sum(w.values()); w = {k: v/s for k,v in w.items()} if s>0 else {}
-    changed = True
-    while changed and w:
-        changed=False; over=[k for k,v in w.items() if v>hard]
-        if over:
-            changed=True; excess=sum(w[k]-hard for k in over)
-            for k in over: w[k]=hard
-            rem=[k for k in w if k not in over]; rs=sum(w[k] for k in rem)
-            for k in rem:
-                w[k] = w[k] + (w[k]/(rs+1e-9))*excess if rs>0 else w[k]
-    s = sum(w.values()); w = {k: v/s for k,v in w.items()} if s>0 else {}
-    return w, explains
+    keys = list(weights)
+    u = np.minimum(np.fromiter(weights.values(), dtype=float, count=len(keys)), cap)
+    if u.sum() <= 0:
+        return {}
+    lo = np.full(len(keys), float(plan.risk.get("min_weight", 0.0)))
+    hi = np.full(len(keys), float(hard))
+    for i, k in enumerate(keys):
+        b = plan.risk.get("weight_bounds", {}).get(k)
+        if b: lo[i] = max(lo[i], b[0]); hi[i] = min(hi[i], b[1])
+    w = capped_simplex(u / u.sum(), lo, hi)
+    return dict(zip(keys, w.tolist()))
 
 def build_trade_plan(current_weights: Dict[str,float], target_weights_: Dict[str,float], nav_usd: float, band_pp: float):
     plan = {}
@@ -1,6 +1,254 @@
-import re
+import functools, re
+from typing import Dict
 import pandas as pd
 
+from engine.indicators import sma, ema, rsi, atr, adx
+
+# ---------- Gate expression compiler ----------
+# expr examples:
+#   "CLOSE > SMA(30)"
+#   "VOLUME > 1.2*SMA(30,VOLUME)"
+#   "RSI(14) < 70 AND (CLOSE > EMA(50) OR SENTIMENT >= GOOD)"
+#   "EMA(20) CROSSES ABOVE EMA(50)"
+# Grammar (case-insensitive):
+#   or   := and ("OR" and)*
+#   and  := not ("AND" not)*
+#   not  := "NOT" not | cmp
+#   cmp  := sum [(> | < | >= | <= | == | != | CROSSES_ABOVE | CROSSES_BELOW) sum]
+#   sum  := prod (("+" | "-") prod)*
+#   prod := unary (("*" | "/") unary)*
+#   unary:= "-" unary | NUMBER | NAME | NAME "(" args ")" | "(" or ")"
+# Names resolve to a df column when present (e.g. pre-materialised SMA_30, RSI_14)
+# and are otherwise derived on demand through engine.indicators.
+
+_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([A-Z_][A-Z0-9_]*)|(>=|<=|==|!=|>|<|\(|\)|,|\*|/|\+|-))")
+_CMP = {">", "<", ">=", "<=", "==", "!=", "CROSSES_ABOVE", "CROSSES_BELOW"}
+_FIELDS = {"CLOSE": "close", "PRICE": "close", "OPEN": "open", "HIGH": "high", "LOW": "low", "VOLUME": "volume"}
+_CONSTS = {"GOOD": 0.30, "BAD": -0.30}
+_DERIVED = re.compile(r"(VOL_SMA|SMA|EMA|RSI|ATR|ADX)_(\d+)$|RET_(\d+)D$")
+
+def _tokenize(expr: str) -> list:
+    s = re.sub(r"CROSSES\s+(ABOVE|BELOW)", r"CROSSES_\1", expr.upper().strip())
+    toks, pos = [], 0
+    while pos < len(s):
+        m = _TOKEN.match(s, pos)
+        if not m or m.end() == pos:
+            if s[pos:].strip() == "": break
+            raise ValueError(f"Bad expr: {expr}")
+        num, name, op = m.groups()
+        toks.append(("num", float(num)) if num else ("name", name) if name else ("op", op))
+        pos = m.end()
+    return toks
+
+class _Parser:
+    def __init__(self, expr: str):
+        self.expr = expr; self.toks = _tokenize(expr); self.i = 0
+
+    def peek(self):
+        return self.toks[self.i] if self.i < len(self.toks) else (None, None)
+
+    def take(self, value=None):
+        tok = self.peek()
+        if tok[0] is None or (value is not None and tok[1] != value):
+            raise ValueError(f"Bad expr: {self.expr}")
+        self.i += 1
+        return tok
+
+    def parse(self):
+        node = self.or_()
+        if self.i != len(self.toks): raise ValueError(f"Bad expr: {self.expr}")
+        return node
+
+    def or_(self):
+        node = self.and_()
+        while self.peek() == ("name", "OR"):
+            self.take(); node = ("or", node, self.and_())
+        return node
+
+    def and_(self):
+        node = self.not_()
+        while self.peek() == ("name", "AND"):
+            self.take(); node = ("and", node, self.not_())
+        return node
+
+    def not_(self):
+        if self.peek() == ("name", "NOT"):
+            self.take(); return ("not", self.not_())
+        return self.cmp()
+
+    def cmp(self):
+        node = self.sum_()
+        kind, val = self.peek()
+        if val in _CMP and kind in ("op", "name"):
+            self.take(); node = ("cmp", val, node, self.sum_())
+        return node
+
+    def sum_(self):
+        node = self.prod()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = self.take()[1]; node = ("arith", op, node, self.prod())
+        return node
+
+    def prod(self):
+        node = self.unary()
+        while self.peek() in (("op", "*"), ("op", "/")):
+            op = self.take()[1]; node = ("arith", op, node, self.unary())
+        return node
+
+    def unary(self):
+        kind, val = self.peek()
+        if (kind, val) == ("op", "-"):
+            self.take(); return ("neg", self.unary())
+        if (kind, val) == ("op", "("):
+            self.take(); node = self.or_(); self.take(")"); return node
+        if kind == "num":
+            self.take(); return ("num", val)
+        if kind == "name":
+            self.take()
+            if self.peek() == ("op", "("):
+                self.take(); args = []
+                if self.peek() != ("op", ")"):
+                    args.append(self.sum_())
+                    while self.peek() == ("op", ","):
+                        self.take(); args.append(self.sum_())
+                self.take(")")
+                return ("call", val, tuple(args))
+            return ("name", val)
+        raise ValueError(f"Bad expr: {self.expr}")
+
+# ---------- Evaluation ----------
+class _Ctx:
+    """Data for one evaluation: a single asset (Series columns) or a panel (DataFrame per field)."""
+    def __init__(self, df: pd.DataFrame, sent, fields: dict | None = None):
+        self.df = df; self.sent = sent
+        self.fields = fields
+        self.index = df.index if df is not None else next(iter(fields.values())).index
+
+    def field(self, name: str):
+        return self.df[name] if self.fields is None else self.fields[name]
+
+    def sentiment(self):
+        if self.fields is not None: return self.sent
+        if self.sent is None:
+            return pd.Series(index=self.index, data=0.0)   # treat as neutral if missing
+        return self.sent.reindex(self.index).ffill().fillna(0.0)
+
+    def column(self, name: str):
+        cols = self.df if self.df is not None else self.fields
+        if name in cols: return cols[name]
+        if name.lower() in cols: return cols[name.lower()]
+        return None
+
+def _per_column(fn, *frames, **kw):
+    if isinstance(frames[0], pd.DataFrame):
+        return pd.DataFrame({c: fn(*(f[c] for f in frames), **kw) for c in frames[0].columns})
+    return fn(*frames, **kw)
+
+def _indicator(ctx: _Ctx, fname: str, n: int, src: str | None = None):
+    c = ctx.field("close")
+    if fname == "SMA":     return sma(ctx.field(_FIELDS.get(src or "CLOSE", "close")), n)
+    if fname == "VOL_SMA": return sma(ctx.field("volume"), n)
+    if fname == "EMA":     return ema(ctx.field(_FIELDS.get(src or "CLOSE", "close")), n)
+    if fname == "RSI":     return rsi(c, n)
+    if fname == "ATR":     return _per_column(atr, ctx.field("high"), ctx.field("low"), c, n=n)
+    if fname == "ADX":     return _per_column(adx, ctx.field("high"), ctx.field("low"), c, n=n)
+    if fname == "RET":     return c.pct_change(n).fillna(0.0)
+    raise ValueError(f"Unknown indicator: {fname}")
+
+def _column_name(fname: str, n: int, src: str | None) -> str | None:
+    # the pre-materialised column a call reads, in the NAME_n form _DERIVED parses
+    src = src or "CLOSE"
+    if fname in ("SMA", "EMA") and _FIELDS.get(src) == "close": return f"{fname}_{n}"
+    if fname == "SMA" and src == "VOLUME": return f"VOL_SMA_{n}"
+    if fname in ("VOL_SMA", "RSI", "ATR", "ADX"): return f"{fname}_{n}"
+    if fname == "RET": return f"RET_{n}D"
+    return None
+
+def _eval(node, ctx: _Ctx):
+    kind = node[0]
+    if kind == "num":  return node[1]
+    if kind == "neg":  return -_eval(node[1], ctx)
+    if kind == "name":
+        name = node[1]
+        if name == "SENTIMENT": return ctx.sentiment()
+        if name in _CONSTS: return _CONSTS[name]
+        col = ctx.column(name)
+        if col is not None: return col
+        if name in _FIELDS: return ctx.field(_FIELDS[name])
+        m = _DERIVED.match(name)
+        if m:
+            return _indicator(ctx, "RET", int(m.group(3))) if m.group(3) else _indicator(ctx, m.group(1), int(m.group(2)))
+        raise ValueError(f"Unknown term: {name}")
+    if kind == "call":
+        fname, args = node[1], node[2]
+        if not args or args[0][0] != "num": raise ValueError(f"Bad call: {fname}")
+        n, src = int(args[0][1]), args[1][1] if len(args) > 1 and args[1][0] == "name" else None
+        name = _column_name(fname, n, src)
+        col = ctx.column(name) if name else None
+        return col if col is not None else _indicator(ctx, fname, n, src)
+    if kind == "arith":
+        op, l, r = node[1], _eval(node[2], ctx), _eval(node[3], ctx)
+        if op == "+": return l + r
+        if op == "-": return l - r
+        if op == "*": return l * r
+        return l / r
+    if kind == "cmp":
+        op, l, r = node[1], _eval(node[2], ctx), _eval(node[3], ctx)
+        if op == ">":  return l > r
+        if op == "<":  return l < r
+        if op == ">=": return l >= r
+        if op == "<=": return l <= r
+        if op == "==": return l == r
+        if op == "!=": return l != r
+        lp = l.shift(1) if hasattr(l, "shift") else l
+        rp = r.shift(1) if hasattr(r, "shift") else r
+        if op == "CROSSES_ABOVE": return (l > r) & (lp <= rp)
+        return (l < r) & (lp >= rp)
+    if kind == "not":
+        x = _as_bool(_eval(node[1], ctx))
+        return (not x) if isinstance(x, bool) else ~x
+    if kind == "and": return _as_bool(_eval(node[1], ctx)) & _as_bool(_eval(node[2], ctx))
+    if kind == "or":  return _as_bool(_eval(node[1], ctx)) | _as_bool(_eval(node[2], ctx))
+    raise ValueError(f"Bad node: {kind}")
+
+def _as_bool(x):
+    if isinstance(x, pd.Series): return x if x.dtype == bool else x > 0
+    if isinstance(x, pd.DataFrame): return x if (x.dtypes == bool).all() else x > 0
+    return bool(x)
+
+def _is_bool_node(node) -> bool:
+    return node[0] in ("cmp", "and", "or", "not")
+
+class CompiledGate:
+    """A parsed gate expression; evaluate() returns a boolean Series aligned to df."""
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.ast = _Parser(expr).parse()
+
+    def _finish(self, out, index, columns=None):
+        if not _is_bool_node(self.ast):
+            out = out > 0          # bare expressions like 'SMA(30)' or 'SENTIMENT'
+        if columns is not None:
+            if not isinstance(out, pd.DataFrame):
+                out = pd.DataFrame({c: out for c in columns}, index=index)
+            return out.fillna(False).astype(bool)
+        if not isinstance(out, pd.Series):
+            out = pd.Series(bool(out), index=index)
+        return out.fillna(False).astype(bool)
+
+    def evaluate(self, df: pd.DataFrame, sent: pd.Series | None = None) -> pd.Series:
+        return self._finish(_eval(self.ast, _Ctx(df, sent)), df.index)
+
+    def evaluate_panel(self, fields: Dict[str,pd.DataFrame], sent: pd.DataFrame) -> pd.DataFrame:
+        """Evaluate on wide frames (index = time, columns = assets) in one pass."""
+        close = fields["close"]
+        return self._finish(_eval(self.ast, _Ctx(None, sent, fields)), close.index, close.columns)
+
+@functools.lru_cache(maxsize=512)
+def compile_gate(expr: str) -> CompiledGate:
+    return CompiledGate(expr)
+
 def evaluate_gate(expr: str, df: pd.DataFrame, sent: pd.Series) -> pd.Series:
     """
     expr examples:
@@ -8,91 +256,47 @@ def evaluate_gate(expr: str, df: pd.DataFrame, sent: pd.Series) -> pd.Series:
       "VOLUME > 1.2*SMA(30,VOLUME)"
       "RSI(14) < 70"
       "SENTIMENT >= 0.30"
-    df columns: close, volume, SMA_30, VOL_SMA_30, EMA_50, RSI_14, RET_60D
+    df columns: open/high/low/close/volume; indicator columns such as SMA_30 or
+    RSI_14 are used when present and derived on demand otherwise.
     sent: Series (same index) or None
     """
-    E = expr.upper().strip()
+    return compile_gate(expr).evaluate(df, sent)
 
-    # Replace tokens with df[...] lookups
-    def col(tok):
-        if tok == "CLOSE": return "close"
-        if tok == "VOLUME": return "volume"
-        return tok
+def evaluate_gates(gates: dict, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series]) -> Dict[str,pd.Series]:
+    """Eligibility per asset for {"all_of": [...], "any_of": [...]} gate lists.
 
-    # Derived indicators mapping by regex
-    E = re.sub(r"SMA\((\d+),VOLUME\)", r"VOL_SMA_\1", E)
-    E = re.sub(r"SMA\((\d+)\)", r"SMA_\1", E)
-    E = re.sub(r"EMA\((\d+)\)", r"EMA_\1", E)
-    E = E.replace("RSI(14)", "RSI_14")
-    E = E.replace("RET_60D", "RET_60D")
-
-    # Map sentiment words are already numeric at planner, but keep safety:
-    E = E.replace("GOOD", "0.30").replace("BAD", "-0.30")
-
-    # Tokenize simple patterns like: LHS (op) RHS, with optional scalar*col
-    # We support forms: COL op COL; COL op k*COL; COL op number; SENTIMENT op number
-    m = re.match(r"(.+?)\s*(>=|<=|>|<|==)\s*(.+)", E)
-    if not m:
-        # allow bare expressions like 'SMA(30)' or 'SMA_30' or 'SENTIMENT'
-        try:
-            S = None
-            def series_of_simple(term: str) -> pd.Series:
-                term = term.strip()
-                if term == "SENTIMENT":
-                    if sent is None:
-                        return pd.Series(index=df.index, data=0.0)
-                    return sent.reindex(df.index).ffill().fillna(0.0)
-                mm = re.match(r"([0-9]*\.?[0-9]+)\s*\*\s*([A-Z0-9_]+)", term)
-                if mm:
-                    k = float(mm.group(1))
-                    colname = col(mm.group(2))
-                    return k * df[colname]
-                if term in df.columns: return df[term]
-                try:
-                    val = float(term)
-                    return pd.Series(index=df.index, data=val)
-                except:
-                    colname = col(term)
-                    return df[colname]
-            S = series_of_simple(E)
-            try:
-                return S > 0
-            except Exception:
-                return S.astype(bool)
-        except Exception:
-            raise ValueError(f"Bad expr: {expr}")
-    lhs, op, rhs = m.groups()
-
-    def series_of(term: str) -> pd.Series:
-        term = term.strip()
-        if term == "SENTIMENT":
-            if sent is None: 
-                return pd.Series(index=df.index, data=0.0)  # treat as neutral if missing
-            # use .ffill() instead of deprecated fillna(method=...)
-            return sent.reindex(df.index).ffill().fillna(0.0)
-        # scalar * column?
-        mm = re.match(r"([0-9]*\.?[0-9]+)\s*\*\s*([A-Z0-9_]+)", term)
-        if mm:
-            k = float(mm.group(1))
-            colname = col(mm.group(2))
-            return k * df[colname]
-        # column?
-        if term in df.columns: return df[term]
-        # scalar?
-        try:
-            val = float(term)
-            return pd.Series(index=df.index, data=val)
-        except:
-            # maybe raw token e.g. CLOSE/VOLUME
-            colname = col(term)
-            return df[colname]
-
-    L = series_of(lhs)
-    R = series_of(rhs)
-
-    if op == ">":  return (L >  R)
-    if op == "<":  return (L <  R)
-    if op == ">=": return (L >= R)
-    if op == "<=": return (L <= R)
-    if op == "==": return (L == R)
-    raise ValueError("op")
+    Assets sharing the same index are stacked into wide frames and every gate is
+    evaluated once across them; an asset is never padded with rows it does not have.
+    """
+    groups: list = []                                  # [(index, [assets])]
+    for a, df in ohlcv.items():
+        for idx, members in groups:
+            if idx.equals(df.index):
+                members.append(a); break
+        else:
+            groups.append((df.index, [a]))
+    out = {}
+    for idx, assets in groups:
+        elig = _eligibility(gates, {a: ohlcv[a] for a in assets}, sentiment, idx)
+        out.update({a: elig[a] for a in assets})
+    return {a: out[a] for a in ohlcv}
+
+def _eligibility(gates: dict, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series], idx) -> pd.DataFrame:
+    assets = list(ohlcv)
+    fields = {f: pd.DataFrame({a: ohlcv[a][f] for a in assets}, index=idx)
+              for f in ("open", "high", "low", "close", "volume") if all(f in ohlcv[a].columns for a in assets)}
+    sent = pd.DataFrame({a: (sentiment[a].reindex(idx).ffill().fillna(0.0) if a in sentiment and sentiment[a] is not None
+                             else pd.Series(0.0, index=idx)) for a in assets})
+    elig = pd.DataFrame(True, index=idx, columns=assets)
+    for g in gates.get("all_of", []):
+        elig &= compile_gate(_gate_expr(g)).evaluate_panel(fields, sent)
+    any_of = gates.get("any_of", [])
+    if any_of:
+        hit = pd.DataFrame(False, index=idx, columns=assets)
+        for g in any_of:
+            hit |= compile_gate(_gate_expr(g)).evaluate_panel(fields, sent)
+        elig &= hit
+    return elig
+
+def _gate_expr(g) -> str:
+    return g["expr"] if isinstance(g, dict) else getattr(g, "expr", g)
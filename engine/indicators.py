@@ -24,25 +24,133 @@
 #     return c.pct_change(60).fillna(0.0)
 
 # indicators.py
+import bisect, functools, hashlib, os, threading
+from collections import OrderedDict
+from dataclasses import dataclass
 import numpy as np
 import pandas as pd
 
+from engine.profiling import timed
+
 EPS = 1e-9
 
+# ---------- Memoization ----------
+# Scoring, explains and regime classification all ask for the same EMA/ADX/RSI/...
+# of the same window. Results are cached in an LRU keyed by a fingerprint of the
+# input Series (name, length, a hash of the whole index and one of the raw values,
+# both read in place) plus the parameters, and bounded by the total nbytes of the
+# cached results (INDICATOR_CACHE_MB, default 64). Cached Series are shared between
+# callers: treat them as read-only.
+def _nbytes(v) -> int:
+    if isinstance(v, (pd.Series, pd.DataFrame)): return int(np.sum(v.memory_usage(index=True)))
+    if isinstance(v, np.ndarray): return v.nbytes
+    if isinstance(v, (tuple, list)): return sum(_nbytes(x) for x in v)
+    return 64
+
+class IndicatorCache:
+    def __init__(self, max_bytes: int | None = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("INDICATOR_CACHE_MB", 64)) * 2**20)
+        self.max_bytes = max_bytes
+        self.hits = 0; self.misses = 0
+        self._d: OrderedDict = OrderedDict()          # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._d:
+                self._d.move_to_end(key); self.hits += 1
+                return True, self._d[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        n = _nbytes(value)
+        if n > self.max_bytes: return
+        with self._lock:
+            old = self._d.pop(key, None)
+            if old is not None: self._bytes -= old[1]
+            self._d[key] = (value, n); self._bytes += n
+            while self._bytes > self.max_bytes:
+                self._bytes -= self._d.popitem(last=False)[1][1]
+
+    def info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._d),
+                "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._d.clear(); self._bytes = 0; self.hits = 0; self.misses = 0
+
+_CACHE = IndicatorCache()
+
+def cache_info() -> dict:
+    return _CACHE.info()
+
+def cache_clear():
+    _CACHE.clear()
+
+def set_cache_bytes(max_bytes: int):
+    """Resize the indicator cache; 0 disables memoization."""
+    with _CACHE._lock:
+        _CACHE.max_bytes = max_bytes
+        while _CACHE._d and _CACHE._bytes > max_bytes:
+            _CACHE._bytes -= _CACHE._d.popitem(last=False)[1][1]
+
+def _digest(a: np.ndarray) -> bytes:
+    # blake2b reads the buffer in place; only non-contiguous views are copied
+    return hashlib.blake2b(np.ascontiguousarray(a).view(np.uint8), digest_size=16).digest()
+
+def _fingerprint(x):
+    if isinstance(x, pd.Series):
+        v = x.to_numpy()
+        if v.dtype.kind not in "biuf": raise TypeError("unhashable series")
+        if len(x) == 0: return ("S", 0)
+        idx = x.index
+        ih = _digest(idx.asi8) if isinstance(idx, pd.DatetimeIndex) else \
+             _digest(pd.util.hash_pandas_object(idx, index=False).to_numpy())
+        return ("S", x.name, len(x), ih, _digest(v))
+    hash(x)
+    return x
+
+def _memo(fn):
+    run = timed("indicators")(fn)      # cache misses show up in engine.profiling reports
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _CACHE.max_bytes <= 0:
+            return run(*args, **kwargs)
+        try:
+            key = (fn.__name__, tuple(_fingerprint(a) for a in args),
+                   tuple(sorted((k, _fingerprint(v)) for k, v in kwargs.items())))
+        except TypeError:
+            return run(*args, **kwargs)
+        found, val = _CACHE.get(key)
+        if found: return val
+        val = run(*args, **kwargs)
+        _CACHE.put(key, val)
+        return val
+    return wrapper
+
 # ---------- Basics ----------
+@_memo
 def sma(s: pd.Series, n: int) -> pd.Series:
     return s.rolling(n, min_periods=n).mean()
 
+@_memo
 def ema(s: pd.Series, n: int) -> pd.Series:
     return s.ewm(span=n, adjust=False, min_periods=n).mean()
 
+@_memo
 def true_range(high: pd.Series, low: pd.Series, close: pd.Series) -> pd.Series:
     pc = close.shift(1)
     return pd.concat([(high-low), (high-pc).abs(), (low-pc).abs()], axis=1).max(axis=1)
 
+@_memo
 def atr(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14) -> pd.Series:
     return true_range(high, low, close).ewm(alpha=1/n, adjust=False, min_periods=n).mean()
 
+@_memo
 def rsi(close: pd.Series, n: int = 14) -> pd.Series:
     d = close.diff()
     up, dn = d.clip(lower=0), -d.clip(upper=0)
@@ -51,6 +159,45 @@ def rsi(close: pd.Series, n: int = 14) -> pd.Series:
     rs = au / (ad + EPS)
     return 100 - 100/(1+rs)
 
+# Trailing-window variants: the value at bar j is what the batch function returns on
+# x.iloc[j-window+1 : j+1]. An adjust=False EWM restarted at bar p differs from the
+# full-history one by a decaying constant, y_win[j] = y[j] - b**(j-p) * (y[p] - x[p]),
+# so the whole history is still one ewm pass.
+def ewm_raw(x: np.ndarray, alpha: float) -> np.ndarray:
+    """adjust=False EWM of the whole array, no min_periods; leading NaNs are skipped like pandas does."""
+    return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+def ewm_restart(y_j, y_p, first, alpha: float, k):
+    """The EWM at bar j restarted k = j-p bars earlier from `first` at bar p, given y_j and
+    y_p of the full-history ewm_raw. Works on scalars and on aligned arrays."""
+    return y_j - (1 - alpha) ** k * (y_p - first)
+
+def _ewm_window(x: pd.Series, alpha: float, window: int, min_periods: int, lead: int = 0) -> pd.Series:
+    v = x.to_numpy(dtype=float)
+    if len(v) == 0: return x.astype(float)
+    y = ewm_raw(v, alpha)
+    j = np.arange(len(v))
+    p = np.maximum(0, j - window + 1) + lead          # first valid bar of each window
+    pc = np.minimum(p, len(v) - 1)
+    out = ewm_restart(y, y[pc], v[pc], alpha, j - p)
+    out[j - p + 1 < min_periods] = np.nan
+    return pd.Series(out, index=x.index, name=x.name)
+
+@_memo
+def ema_window(s: pd.Series, n: int, window: int | None = None) -> pd.Series:
+    if window is None: return ema(s, n)
+    return _ewm_window(s, 2.0/(n+1), window, n)
+
+@_memo
+def rsi_window(close: pd.Series, n: int = 14, window: int | None = None) -> pd.Series:
+    if window is None: return rsi(close, n)
+    d = close.diff()
+    au = _ewm_window(d.clip(lower=0), 1/n, window, n, lead=1)
+    ad = _ewm_window(-d.clip(upper=0), 1/n, window, n, lead=1)
+    rs = au / (ad + EPS)
+    return 100 - 100/(1+rs)
+
+@_memo
 def stoch_rsi(close: pd.Series, n: int = 14, smooth_k: int = 3, smooth_d: int = 3):
     r = rsi(close, n)
     ll = r.rolling(n, min_periods=n).min()
@@ -60,12 +207,14 @@ def stoch_rsi(close: pd.Series, n: int = 14, smooth_k: int = 3, smooth_d: int =
     d = k.rolling(smooth_d, min_periods=smooth_d).mean()
     return k, d
 
+@_memo
 def macd(close: pd.Series, fast=12, slow=26, signal=9):
     m = ema(close, fast) - ema(close, slow)
     s = ema(m, signal)
     return m, s, m - s
 
 # ---------- DI/ADX ----------
+@_memo
 def di_plus_minus(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14):
     up_move = high.diff()
     down_move = -low.diff()
@@ -77,18 +226,22 @@ def di_plus_minus(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14
     minus_di = 100 * (pd.Series(minus_dm, index=low.index).ewm(alpha=1/n, adjust=False, min_periods=n).mean() / (atr_n + EPS))
     return plus_di, minus_di
 
+@_memo
 def adx(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14) -> pd.Series:
     pdi, mdi = di_plus_minus(high, low, close, n)
     dx = 100 * (pdi.subtract(mdi).abs() / (pdi + mdi + EPS))
     return dx.ewm(alpha=1/n, adjust=False, min_periods=n).mean()
 
 # ---------- Channels & Bands ----------
+@_memo
 def donchian_high(high: pd.Series, n: int = 20) -> pd.Series:
     return high.rolling(n, min_periods=n).max()
 
+@_memo
 def donchian_low(low: pd.Series, n: int = 20) -> pd.Series:
     return low.rolling(n, min_periods=n).min()
 
+@_memo
 def bollinger(close: pd.Series, n: int = 20, k: float = 2.0):
     m = sma(close, n)
     sd = close.rolling(n, min_periods=n).std()
@@ -97,12 +250,14 @@ def bollinger(close: pd.Series, n: int = 20, k: float = 2.0):
     pct_b = (close - lower) / (upper - lower + EPS) # %B
     return m, upper, lower, bw, pct_b
 
+@_memo
 def keltner(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 20, m: float = 1.5):
     mid = ema(close, n)
     atr_n = atr(high, low, close, n)
     upper, lower = mid + m*atr_n, mid - m*atr_n
     return mid, upper, lower
 
+@_memo
 def squeeze_bb_kc(close, high, low, n_bb=20, k=2.0, n_kc=20, m=1.5):
     _, bb_u, bb_l, _, _ = bollinger(close, n_bb, k)
     kc_m, kc_u, kc_l = keltner(high, low, close, n_kc, m)
@@ -111,21 +266,25 @@ def squeeze_bb_kc(close, high, low, n_bb=20, k=2.0, n_kc=20, m=1.5):
     return squeeze_on
 
 # ---------- Volume & Flow ----------
+@_memo
 def vwap(close: pd.Series, volume: pd.Series) -> pd.Series:
     tp = close
     cum_pv = (tp * volume).cumsum()
     cum_v = volume.cumsum().replace(0, np.nan)
     return cum_pv / (cum_v + EPS)
 
+@_memo
 def obv(close: pd.Series, volume: pd.Series) -> pd.Series:
     direction = np.sign(close.diff()).fillna(0.0)
     return (volume * direction).cumsum()
 
+@_memo
 def cmf(high: pd.Series, low: pd.Series, close: pd.Series, volume: pd.Series, n: int = 20) -> pd.Series:
     mf_mult = ((close - low) - (high - close)) / (high - low + EPS)
     mf_vol = mf_mult * volume
     return mf_vol.rolling(n, min_periods=n).sum() / (volume.rolling(n, min_periods=n).sum() + EPS)
 
+@_memo
 def mfi(high: pd.Series, low: pd.Series, close: pd.Series, volume: pd.Series, n: int = 14) -> pd.Series:
     tp = (high + low + close) / 3.0
     mf = tp * volume
@@ -137,6 +296,20 @@ def mfi(high: pd.Series, low: pd.Series, close: pd.Series, volume: pd.Series, n:
     return 100 - (100 / (1 + mr))
 
 # ---------- Support / Resistance ----------
+def pivot_mask(values, k: int = 5, kind: str = "min") -> np.ndarray:
+    """Bool mask of bars that are the min (or max) of the k-bar window centred on them.
+
+    Same result as Series.rolling(k, center=True).apply(lambda w: w.iloc[k//2] == w.min())
+    == 1.0: edge bars without a full window and windows containing NaN never qualify.
+    """
+    x = np.asarray(values, dtype=float)
+    out = np.zeros(len(x), dtype=bool)
+    if k < 1 or len(x) < k: return out
+    win = np.lib.stride_tricks.sliding_window_view(x, k)
+    ext = win.min(axis=1) if kind == "min" else win.max(axis=1)    # NaN propagates -> no match
+    out[k//2: k//2 + len(win)] = win[:, k//2] == ext
+    return out
+
 def support_levels(high: pd.Series, low: pd.Series, close: pd.Series,
                    lookback: int = 180, k: int = 5, atr_mult: float = 0.75) -> list[float]:
     seg = close.tail(lookback)
@@ -145,44 +318,124 @@ def support_levels(high: pd.Series, low: pd.Series, close: pd.Series,
         atr_est = atr(high, low, close, 14).iloc[-1]
     except Exception:
         atr_est = close.diff().abs().rolling(14).mean().iloc[-1]
-    piv = seg.rolling(k, center=True).apply(lambda w: float(w.iloc[k//2] == w.min()), raw=False)
-    lvls = seg[piv == 1.0]
-    clusters = []
+    lvls = seg.to_numpy()[pivot_mask(seg.to_numpy(), k, "min")]
+    # Greedy clustering in time order: a level joins the oldest cluster whose anchor
+    # (first level) is within tol, else it anchors a new one. Anchors are kept sorted
+    # so only the two neighbours of a level need checking.
+    tol = atr_mult * atr_est
+    anchors, order = [], []          # sorted anchor prices / their cluster ids
+    hits, sums = [], []
     for p in lvls:
-        placed = False
-        for c in clusters:
-            if abs(p - c["price"]) <= atr_mult * atr_est:
-                c["hits"] += 1; c["sum"] += p; placed = True; break
-        if not placed: clusters.append({"price": p, "hits": 1, "sum": p})
-    for c in clusters: c["price"] = c["sum"]/c["hits"]
-    clusters.sort(key=lambda x: x["hits"], reverse=True)
-    return [c["price"] for c in clusters[:3]]
+        pos = bisect.bisect_left(anchors, p)
+        best = None
+        for q in (pos - 1, pos):
+            if 0 <= q < len(anchors) and abs(p - anchors[q]) <= tol:
+                if best is None or order[q] < best: best = order[q]
+        if best is None:
+            anchors.insert(pos, p); order.insert(pos, len(hits))
+            hits.append(1); sums.append(p)
+        else:
+            hits[best] += 1; sums[best] += p
+    ranked = sorted(range(len(hits)), key=lambda c: hits[c], reverse=True)
+    return [sums[c]/hits[c] for c in ranked[:3]]
+
+# ---------- Volume Profile ----------
+@dataclass
+class VolumeProfile:
+    """Volume-by-price histogram. Arrays are (bins,) for one series or (rows, bins)
+    for a 2-D input; scalar fields become (rows,) arrays. Empty/flat rows are all-NaN."""
+    edges: np.ndarray
+    centers: np.ndarray
+    volumes: np.ndarray
+    poc: np.ndarray       # point of control: center of the max-volume bin
+    val: np.ndarray       # value area low / high: price edges of the contiguous
+    vah: np.ndarray       # block around the POC holding `value_area` of the volume
+
+    def nodes(self, topk: int = 3) -> np.ndarray:
+        """Centers of the topk highest-volume bins (HVNs), highest first."""
+        order = np.argsort(self.volumes, axis=-1)[..., ::-1][..., :topk]
+        return np.take_along_axis(self.centers, order, axis=-1)
+
+def volume_profile(close, volume, bins: int = 40, value_area: float = 0.70) -> VolumeProfile:
+    """Volume profile of one series (1-D) or of many rows at once (2-D: rows x time).
+
+    Each row gets its own linspace(min, max, bins+1) edges; prices are bucketed like
+    np.digitize and summed with a single np.bincount over all rows. NaN prices or
+    volumes (e.g. padding of shorter symbols) are ignored.
+    """
+    x = np.asarray(close, dtype=float); w = np.asarray(volume, dtype=float)
+    one = x.ndim == 1
+    x = np.atleast_2d(x); w = np.atleast_2d(w)
+    rows = x.shape[0]
+    ok = ~(np.isnan(x) | np.isnan(w))
+    with np.errstate(all="ignore"):
+        mn = np.nanmin(np.where(ok, x, np.nan), axis=1) if x.size else np.full(rows, np.nan)
+        mx = np.nanmax(np.where(ok, x, np.nan), axis=1) if x.size else np.full(rows, np.nan)
+    live = mx > mn
+    lo = np.where(live, mn, 0.0); hi = np.where(live, mx, 1.0)
+    edges = np.linspace(lo, hi, bins+1, axis=1)
+    # floor estimate, then nudge by one so edges[idx] <= x < edges[idx+1] exactly as digitize
+    with np.errstate(all="ignore"):
+        idx = np.floor((x - lo[:, None]) / ((hi - lo) / bins)[:, None])
+    idx = np.clip(np.nan_to_num(idx, nan=0.0), 0, bins).astype(np.int64)
+    idx -= x < np.take_along_axis(edges, idx, axis=1)
+    idx += x >= np.take_along_axis(edges, np.minimum(idx+1, bins), axis=1)
+    idx = np.clip(idx, 0, bins-1)
+    keep = ok & live[:, None]
+    flat = (idx + bins*np.arange(rows)[:, None])[keep]
+    vols = np.bincount(flat, weights=w[keep], minlength=rows*bins).astype(float).reshape(rows, bins)
+    centers = (edges[:, :-1] + edges[:, 1:]) / 2.0
+
+    # value area: grow a contiguous block from the POC toward the heavier neighbour
+    top = vols.argmax(axis=1)
+    a = top.copy(); b = top.copy()
+    acc = vols[np.arange(rows), top]; target = value_area * vols.sum(axis=1)
+    for _ in range(bins - 1):
+        grow = acc < target
+        if not grow.any(): break
+        below = np.where(a > 0, vols[np.arange(rows), np.maximum(a-1, 0)], -1.0)
+        above = np.where(b < bins-1, vols[np.arange(rows), np.minimum(b+1, bins-1)], -1.0)
+        up = grow & (above >= below) & (above >= 0)
+        down = grow & ~up & (below >= 0)
+        b = b + up; a = a - down
+        acc = acc + np.where(up, above, 0.0) + np.where(down, below, 0.0)
+    poc = np.where(live, centers[np.arange(rows), top], np.nan)
+    val = np.where(live, edges[np.arange(rows), a], np.nan)
+    vah = np.where(live, edges[np.arange(rows), b+1], np.nan)
+    vols[~live] = np.nan; centers[~live] = np.nan
+    if one:
+        return VolumeProfile(edges[0], centers[0], vols[0], poc[0], val[0], vah[0])
+    return VolumeProfile(edges, centers, vols, poc, val, vah)
+
+def rolling_volume_profile(close, volume, window: int, bins: int = 40, step: int = 1,
+                           value_area: float = 0.70) -> VolumeProfile:
+    """Profiles of every `step`-th trailing window of length `window` (row i covers bars
+    [i*step, i*step + window)). All windows are binned in one 2-D volume_profile pass."""
+    x = np.asarray(close, dtype=float); w = np.asarray(volume, dtype=float)
+    if len(x) < window:
+        return volume_profile(np.empty((0, window)), np.empty((0, window)), bins, value_area)
+    xs = np.lib.stride_tricks.sliding_window_view(x, window)[::step]
+    ws = np.lib.stride_tricks.sliding_window_view(w, window)[::step]
+    return volume_profile(xs, ws, bins, value_area)
 
 def volume_profile_nodes(close: pd.Series, volume: pd.Series, bins: int = 40, topk: int = 3) -> list[float]:
     # Approx HVNs: accumulate volume by price buckets
     if len(close) != len(volume): return []
-    mn, mx = float(close.min()), float(close.max())
-    if mx <= mn: return []
-    edges = np.linspace(mn, mx, bins+1)
-    idx = np.clip(np.digitize(close.values, edges)-1, 0, bins-1)
-    vol_bins = np.zeros(bins)
-    for i, vol in zip(idx, volume.values):
-        vol_bins[i] += vol
-    centers = (edges[:-1] + edges[1:]) / 2.0
-    order = np.argsort(vol_bins)[::-1][:topk]
-    return [float(centers[i]) for i in order]
+    if float(close.max()) <= float(close.min()): return []
+    return [float(x) for x in volume_profile(close.values, volume.values, bins).nodes(topk)]
 
 # ---------- Divergences ----------
+@_memo
 def rsi_divergence(close: pd.Series, n: int = 100, swing: int = 5) -> str:
     # very simple heuristic: last two swing highs/lows in price vs RSI
     r = rsi(close, 14)
     seg_c = close.tail(n); seg_r = r.tail(n)
-    highs = seg_c.rolling(swing, center=True).apply(lambda w: float(w.iloc[swing//2] == w.max()), raw=False)
-    lows  = seg_c.rolling(swing, center=True).apply(lambda w: float(w.iloc[swing//2] == w.min()), raw=False)
-    ph = list(seg_c[highs==1.0].tail(2).values)
-    pr = list(seg_r[highs==1.0].tail(2).values)
-    pl = list(seg_c[lows==1.0].tail(2).values)
-    rl = list(seg_r[lows==1.0].tail(2).values)
+    highs = pivot_mask(seg_c.to_numpy(), swing, "max")
+    lows  = pivot_mask(seg_c.to_numpy(), swing, "min")
+    ph = list(seg_c[highs].tail(2).values)
+    pr = list(seg_r[highs].tail(2).values)
+    pl = list(seg_c[lows].tail(2).values)
+    rl = list(seg_r[lows].tail(2).values)
     if len(ph)==2 and len(pr)==2 and ph[-1]>ph[-2] and pr[-1]<pr[-2]:
         return "bearish_divergence"
     if len(pl)==2 and len(rl)==2 and pl[-1]<pl[-2] and rl[-1]>rl[-2]:
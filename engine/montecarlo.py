@@ -0,0 +1,81 @@
+# montecarlo.py
+# Robustness of a backtest equity curve.
+#  - bootstrap(): circular block bootstrap of the daily returns into a
+#    (paths x time) matrix; all stats are computed column-wise on that matrix,
+#    so 10k paths over 540 days is a handful of NumPy ops, not 10k backtests.
+#  - schedule_jitter(): reruns the backtest with every rebalance date shifted by a
+#    random number of bars, to see how much the result depends on the calendar.
+# Both report percentile intervals for the keys of analytics.performance.
+from __future__ import annotations
+from typing import Dict, Sequence
+import numpy as np
+import pandas as pd
+
+from engine.engine import Plan
+from engine.analytics import performance
+from engine.backtest import run_backtest, rebalance_schedule, equity_stats
+
+
+# ---------- Resampling ----------
+def block_bootstrap(returns: np.ndarray, n_paths: int, block: int = 20, seed: int | None = None) -> np.ndarray:
+    """(n_paths x T) matrix of returns resampled in circular blocks of `block` bars."""
+    r = np.asarray(returns, dtype=float)
+    T = len(r); block = max(1, min(block, T))
+    n_blocks = -(-T // block)
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, T, size=(n_paths, n_blocks))
+    pos = (starts[:, :, None] + np.arange(block)) % T
+    return r[pos.reshape(n_paths, -1)[:, :T]]
+
+def paths_stats(rets: np.ndarray) -> Dict[str,np.ndarray]:
+    """analytics.performance for every row of a (paths x T) return matrix (equity starts at 1)."""
+    rets = np.atleast_2d(rets)
+    eq = np.concatenate([np.ones((rets.shape[0], 1)), np.cumprod(1 + rets, axis=1)], axis=1)
+    return performance(eq)
+
+def summarize(samples: Dict[str,np.ndarray], ci: Sequence[float] = (0.05, 0.5, 0.95)) -> Dict[str,dict]:
+    return {k: {f"p{round(q*100):02d}": float(np.nanquantile(v, q)) for q in ci} | {"mean": float(np.nanmean(v))}
+            for k, v in samples.items()}
+
+# ---------- Public API ----------
+def bootstrap(ec: pd.DataFrame, n_paths: int = 10_000, block: int = 20, seed: int | None = None,
+              ci: Sequence[float] = (0.05, 0.5, 0.95), return_paths: bool = False) -> dict:
+    """Confidence intervals of the backtest stats under a block bootstrap of ec's returns."""
+    rets = ec["equity"].pct_change().dropna().to_numpy()
+    if len(rets) < 2:
+        return {"error": "not enough data"}
+    paths = block_bootstrap(rets, n_paths, block, seed)
+    out = {"n_paths": n_paths, "block": block, "observed": equity_stats(ec), "ci": summarize(paths_stats(paths), ci)}
+    if return_paths:
+        out["paths"] = paths
+    return out
+
+def jitter_schedule(dates: pd.DatetimeIndex, idx: pd.DatetimeIndex, max_shift: int,
+                    rng: np.random.Generator) -> pd.DatetimeIndex:
+    """Move each rebalance date to a bar up to max_shift bars earlier or later."""
+    pos = idx.searchsorted(dates)
+    pos = np.clip(pos + rng.integers(-max_shift, max_shift + 1, size=len(pos)), 0, len(idx) - 1)
+    return idx[np.unique(pos)]
+
+def schedule_jitter(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+                    n: int = 50, max_shift: int = 3, seed: int | None = None, start=None, end=None,
+                    ci: Sequence[float] = (0.05, 0.5, 0.95)) -> dict:
+    """Rerun the (vectorized) backtest n times on randomly shifted rebalance calendars."""
+    from engine.vectorized import build_panels
+    from engine.walkforward import aligned_index
+    idx = aligned_index(ohlcv)
+    if start: idx = idx[idx >= pd.to_datetime(start, utc=True)]
+    if end:   idx = idx[idx <= pd.to_datetime(end, utc=True)]
+    if len(idx) < 60:
+        return {"error": "not enough data"}
+    base = rebalance_schedule(plan, idx)
+    panels = build_panels(ohlcv)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        _, stats = run_backtest(plan, ohlcv, sentiment, start=start, end=end, vectorized=True, panels=panels,
+                                rebalance_dates=jitter_schedule(base, idx, max_shift, rng))
+        if "error" not in stats: rows.append(stats)
+    table = pd.DataFrame(rows)
+    return {"n": len(rows), "max_shift": max_shift,
+            "ci": summarize({k: table[k].to_numpy(dtype=float) for k in table.columns}, ci)}
@@ -0,0 +1,161 @@
+# panel.py
+# Cross-sectional scoring: the whole universe as wide frames (index = time,
+# columns = assets) scored in one pass. panel_weights(plan, fields, sentiment)
+# gives the same weights as target_weights(plan, ohlcv, sentiment, explain=False)
+# when the assets share an index; every indicator is a column-wise pandas/NumPy op.
+#
+# The array scorers mirror the scalar *_from helpers in engine.engine, including
+# Python's min/max behaviour on NaN (max(0.0, min(1.0, nan)) == 1.0).
+from __future__ import annotations
+from typing import Dict
+import numpy as np
+import pandas as pd
+
+from engine.indicators import EPS
+from engine.engine import Plan, compile_rules, infer_plan_template, _cap_weights
+from services.planner.regime import regime_labels, map_regime_to_template
+
+FIELDS = ("open", "high", "low", "close", "volume")
+
+def to_panel(ohlcv: Dict[str,pd.DataFrame], window: int | None = None) -> Dict[str,pd.DataFrame]:
+    """Wide frames per field on the index shared by all assets (last `window` bars)."""
+    idx = None
+    for df in ohlcv.values():
+        idx = df.index if idx is None else idx.intersection(df.index)
+    if idx is None:
+        return {f: pd.DataFrame() for f in FIELDS}
+    if window: idx = idx[-window:]
+    return {f: pd.DataFrame({a: df[f].reindex(idx) for a, df in ohlcv.items()}, index=idx)
+            for f in FIELDS if all(f in df for df in ohlcv.values())}
+
+# ---------- Column-wise indicators ----------
+def _ewm(x: pd.DataFrame, alpha: float, n: int) -> pd.DataFrame:
+    return x.ewm(alpha=alpha, adjust=False, min_periods=n).mean()
+
+def true_range(h: pd.DataFrame, l: pd.DataFrame, c: pd.DataFrame) -> pd.DataFrame:
+    pc = c.shift(1)
+    tr = np.fmax(np.fmax((h - l).to_numpy(), (h - pc).abs().to_numpy()), (l - pc).abs().to_numpy())
+    return pd.DataFrame(tr, index=c.index, columns=c.columns)
+
+def atr(h, l, c, n: int = 14) -> pd.DataFrame:
+    return _ewm(true_range(h, l, c), 1/n, n)
+
+def adx(h, l, c, n: int = 14) -> pd.DataFrame:
+    up_move, down_move = h.diff(), -l.diff()
+    plus_dm = up_move.where((up_move > down_move) & (up_move > 0), 0.0)
+    minus_dm = down_move.where((down_move > up_move) & (down_move > 0), 0.0)
+    atr_n = atr(h, l, c, n)
+    pdi = 100 * (_ewm(plus_dm, 1/n, n) / (atr_n + EPS))
+    mdi = 100 * (_ewm(minus_dm, 1/n, n) / (atr_n + EPS))
+    dx = 100 * ((pdi - mdi).abs() / (pdi + mdi + EPS))
+    return _ewm(dx, 1/n, n)
+
+def ema(x: pd.DataFrame, n: int) -> pd.DataFrame:
+    return x.ewm(span=n, adjust=False, min_periods=n).mean()
+
+# ---------- Scores (one value per asset, as of the last row) ----------
+def _clip01(x):
+    # max(0.0, min(1.0, x)) with Python semantics: NaN -> 1.0
+    x = np.asarray(x, dtype=float)
+    return np.where(x < 1.0, np.where(x > 0.0, x, 0.0), 1.0)
+
+def _last(x: pd.DataFrame) -> np.ndarray:
+    return x.iloc[-1].to_numpy(dtype=float)
+
+def trend_scores(f: Dict[str,pd.DataFrame], adx14: pd.DataFrame | None = None) -> np.ndarray:
+    c = f["close"]
+    adx14 = adx(f["high"], f["low"], c, 14) if adx14 is None else adx14
+    ema50 = ema(c, 50)
+    e50, e200, lag5 = _last(ema50), _last(ema(c, 200)), _last(ema50.shift(5))
+    with np.errstate(invalid="ignore"):
+        t = 0.5*(1 + np.tanh(5*(e50/(lag5 + 1e-9) - 1.0)))
+        z = (_last(adx14) - 10)/30
+        a = np.where(z < 0, 0.0, np.where(z > 1, 1.0, z))
+        bias = np.where(e50 > e200, 0.2, 0.0)
+        return _clip01(0.5*t + 0.5*a + bias)
+
+def momentum_scores(f: Dict[str,pd.DataFrame]) -> np.ndarray:
+    c = f["close"]
+    if len(c) < 60: return np.zeros(c.shape[1])
+    r60 = _last(c)/(_last(c.shift(60)) + 1e-9) - 1.0
+    return _clip01((r60 + 0.5)/2.0)
+
+def volume_scores(f: Dict[str,pd.DataFrame]) -> np.ndarray:
+    v = f["volume"]
+    vs = _last(v.rolling(20).mean())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(vs <= 0, 0.0, _clip01((_last(v)/vs - 1.0)/1.5))
+
+def breakout_scores(f: Dict[str,pd.DataFrame]) -> np.ndarray:
+    c, h, l = f["close"], f["high"], f["low"]
+    dhi = _last(h.rolling(20, min_periods=20).max())
+    return _clip01((_last(c) - dhi)/(_last(atr(h, l, c, 14)) + 1e-9))
+
+def composite_scores(f: Dict[str,pd.DataFrame], coeffs: dict, sent_vals: np.ndarray, template: str,
+                     adx14: pd.DataFrame | None = None) -> np.ndarray:
+    sent_vals = np.asarray(sent_vals, dtype=float)
+    extra = 0.5*breakout_scores(f) if template == "breakout_up" else 0.0
+    s = (coeffs.get("trend",0.35)*trend_scores(f, adx14) +
+         coeffs.get("momentum",0.35)*momentum_scores(f) +
+         coeffs.get("volume",0.15)*volume_scores(f) +
+         coeffs.get("sentiment",0.15)*np.where(sent_vals > 0.0, sent_vals, 0.0) +
+         extra)
+    return _clip01(s)
+
+def regimes(f: Dict[str,pd.DataFrame], adx14: pd.DataFrame | None = None) -> np.ndarray:
+    """classify_regime for every column at the last row."""
+    c, h, l, v = f["close"], f["high"], f["low"], f["volume"]
+    adx14 = adx(h, l, c, 14) if adx14 is None else adx14
+    m = c.rolling(20, min_periods=20).mean(); sd = c.rolling(20, min_periods=20).std()
+    bw = ((m + 2*sd) - (m - 2*sd)) / (m.abs() + EPS)
+    macd_line = ema(c, 12) - ema(c, 26)
+    return regime_labels(_last(c), _last(adx14), (adx14.diff().tail(5) > 0).sum().to_numpy() >= 3,
+                         _last(v) > 1.5*_last(v.rolling(20).mean()), _last(bw), bw.quantile(0.30).to_numpy(),
+                         _last(h.rolling(20, min_periods=20).max()), _last(l.rolling(20, min_periods=20).min()),
+                         _last(ema(c, 50)), _last(ema(c, 200)), _last(macd_line))
+
+# ---------- Weights ----------
+def panel_template(plan: Plan, f: Dict[str,pd.DataFrame], adx14: pd.DataFrame | None = None) -> str:
+    if plan.regime != "auto":
+        return infer_plan_template(plan, {})
+    votes = {}
+    for r in regimes(f, adx14):
+        votes[r] = votes.get(r,0)+1
+    reg = max(votes.items(), key=lambda x:x[1])[0] if votes else "other"
+    return map_regime_to_template(reg)
+
+def _sent_vals(sentiment: Dict[str,pd.Series], assets) -> np.ndarray:
+    out = np.zeros(len(assets))
+    for i, a in enumerate(assets):
+        s = sentiment.get(a)
+        if s is not None and len(s): out[i] = float(s.iloc[-1])
+    return out
+
+def panel_weights(plan: Plan, f: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+                  template: str | None = None) -> Dict[str,float]:
+    """target_weights(..., explain=False)[0] for a wide-frame universe."""
+    c = f["close"]
+    assets = list(c.columns)
+    if not assets: return {}
+    adx14 = adx(f["high"], f["low"], c, 14)
+    template = template or panel_template(plan, f, adx14)
+    coeffs   = plan.weighting.get("coeffs", {"trend":0.35,"momentum":0.35,"volume":0.15,"sentiment":0.15})
+    good     = plan.sentiment_cfg.get("good_threshold", 0.30)
+    bad      = plan.sentiment_cfg.get("bad_threshold", -0.30)
+    tilt_pct = plan.weighting.get("tilt_sentiment_pct", 0.10)
+
+    s_val = _sent_vals(sentiment, assets)
+    base = composite_scores(f, coeffs, s_val, template, adx14)
+    if plan.direction_bias == "bullish":
+        base = np.minimum(1.0, base*1.15)
+    elif plan.direction_bias == "bearish":
+        base = base*np.where(base < 0.7, 0.25, 0.5)
+    tilt = np.where(s_val >= good, tilt_pct*np.minimum(1.0, s_val),
+                    np.where(s_val <= bad, -tilt_pct*np.minimum(1.0, np.abs(s_val)), 0.0))
+    score = np.maximum(0.0, base*(1 + tilt))
+
+    keep = np.ones(len(assets), dtype=bool)
+    if plan.custom_rules:
+        gate_ok = (s_val >= good) if plan.gates.get("sentiment","AUTO") in ("AUTO","GOOD") else np.ones(len(assets), bool)
+        keep = compile_rules(tuple(plan.custom_rules)).check_panel(f, gate_ok)
+    return _cap_weights(plan, {a: float(x) for a, x, k in zip(assets, score, keep) if k})
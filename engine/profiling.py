@@ -0,0 +1,80 @@
+# profiling.py
+# Opt-in stage timings. Code marks stages with
+#     with stage("target_weights"): ...        or        @timed("fetch_headlines")
+# and a caller collects them with
+#     with profile() as prof: ...;  prof.report()
+# Without an active profile() a stage costs one ContextVar lookup and returns a
+# shared no-op context manager. The profiler follows contextvars, so concurrent
+# requests (threads, asyncio tasks) each see only their own stages.
+# Nested stages with the same name are timed once, at the outermost level
+# (e.g. an indicator that calls other indicators).
+from __future__ import annotations
+import functools, threading, time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+_ACTIVE: ContextVar["Profiler | None"] = ContextVar("engine_profiler", default=None)
+_NULL = nullcontext()
+
+class Profiler:
+    def __init__(self):
+        self.stats: dict = {}            # name -> [calls, total_s, max_s]
+        self._open: dict = {}            # name -> nesting depth
+        self._lock = threading.Lock()
+        self.t0 = time.perf_counter()
+
+    def add(self, name: str, dt: float, calls: int = 1):
+        with self._lock:
+            st = self.stats.get(name)
+            if st is None: self.stats[name] = [calls, dt, dt]
+            else: st[0] += calls; st[1] += dt; st[2] = max(st[2], dt)
+
+    @contextmanager
+    def stage(self, name: str):
+        with self._lock:
+            depth = self._open.get(name, 0); self._open[name] = depth + 1
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t
+            with self._lock: self._open[name] -= 1
+            if depth == 0: self.add(name, dt)
+
+    def report(self) -> dict:
+        """{"total_ms": wall time, "stages": {name: {calls, total_ms, max_ms}}}, slowest first."""
+        rows = sorted(self.stats.items(), key=lambda kv: -kv[1][1])
+        return {"total_ms": round((time.perf_counter() - self.t0)*1e3, 3),
+                "stages": {k: {"calls": c, "total_ms": round(tot*1e3, 3), "max_ms": round(mx*1e3, 3)}
+                           for k, (c, tot, mx) in rows}}
+
+def stage(name: str):
+    prof = _ACTIVE.get()
+    return _NULL if prof is None else prof.stage(name)
+
+def timed(name: str | None = None):
+    def deco(fn):
+        label = name or fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            prof = _ACTIVE.get()
+            if prof is None: return fn(*args, **kwargs)
+            with prof.stage(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def active() -> Profiler | None:
+    return _ACTIVE.get()
+
+@contextmanager
+def profile(enabled: bool = True):
+    """Collect stage timings inside the block; yields None when disabled."""
+    if not enabled:
+        yield None; return
+    prof = Profiler()
+    token = _ACTIVE.set(prof)
+    try:
+        yield prof
+    finally:
+        _ACTIVE.reset(token)
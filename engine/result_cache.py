@@ -0,0 +1,147 @@
+# result_cache.py
+# Backtest results keyed by (canonical plan hash, start, end, data version, code version).
+# The data version is the length and last (timestamp, value) of every OHLCV input
+# and sentiment series, so a new bar changes the key and old entries simply stop
+# being hit; the code version hashes CACHE_VERSION and the sources run_backtest
+# depends on (engine/ and services/planner/regime.py), so a code change never serves
+# results computed by older code. Two tiers: an in-process LRU and pickles on disk
+# (shared by workers and kept across restarts; disk entries older than max_age_s are
+# dropped).
+#
+# BACKTEST_CACHE_DIR overrides the directory (default .cache/backtests);
+# set it to an empty string to disable the disk tier.
+from __future__ import annotations
+import hashlib, json, os, pickle, tempfile, threading, time
+from collections import OrderedDict
+from typing import Any, Dict
+import pandas as pd
+
+CACHE_VERSION = 1                     # bump when the cached result layout changes
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SOURCES = ("engine", os.path.join("services", "planner", "regime.py"))   # everything run_backtest imports
+
+def _code_version() -> str:
+    h = hashlib.sha256(str(CACHE_VERSION).encode())
+    for src in _SOURCES:
+        path = os.path.join(_ROOT, src)
+        names = sorted(n for n in os.listdir(path) if n.endswith(".py")) if os.path.isdir(path) else [""]
+        for name in names:
+            with open(os.path.join(path, name) if name else path, "rb") as f:
+                h.update(os.path.join(src, name).encode()); h.update(f.read())
+    return h.hexdigest()[:16]
+
+CODE_VERSION = _code_version()
+
+def plan_hash(plan: dict) -> str:
+    """Hash of the plan JSON that ignores key order and whitespace."""
+    blob = json.dumps(plan, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def data_version(ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series] | None = None) -> tuple:
+    # the last close is included because exchanges return the still-forming bar
+    def last(x):
+        if x is None or not len(x): return (0, None, None)
+        v = x["close"].iloc[-1] if isinstance(x, pd.DataFrame) else x.iloc[-1]
+        return (len(x), str(x.index[-1]), float(v))
+    return (tuple(sorted((a, *last(df)) for a, df in ohlcv.items())),
+            tuple(sorted((a, *last(s)) for a, s in (sentiment or {}).items())))
+
+def backtest_key(plan: dict, start=None, end=None, version: tuple = ()) -> str:
+    blob = json.dumps([plan_hash(plan), start, end, version, CODE_VERSION], default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, maxsize: int = 256, directory: str | None = None, max_age_s: float = 7*24*3600):
+        self.maxsize = maxsize
+        self.max_age_s = max_age_s
+        if directory is None:
+            directory = os.getenv("BACKTEST_CACHE_DIR", os.path.join(".cache", "backtests"))
+        self.directory = directory or None
+        self._mem: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key); self.hits += 1
+                return True, self._mem[key]
+        if self.directory:
+            path = self._path(key)
+            try:
+                if time.time() - os.path.getmtime(path) <= self.max_age_s:
+                    with open(path, "rb") as f:
+                        val = pickle.load(f)
+                    self._remember(key, val)
+                    with self._lock: self.disk_hits += 1
+                    return True, val
+                os.remove(path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+        with self._lock: self.misses += 1
+        return False, None
+
+    def put(self, key: str, val: Any):
+        self._remember(key, val)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(val, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self._path(key))     # atomic: readers never see half a file
+            except OSError:
+                pass
+
+    def _remember(self, key: str, val: Any):
+        with self._lock:
+            self._mem[key] = val; self._mem.move_to_end(key)
+            while len(self._mem) > self.maxsize:
+                self._mem.popitem(last=False)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "size": len(self._mem), "maxsize": self.maxsize, "directory": self.directory}
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._mem.clear(); self.hits = self.disk_hits = self.misses = 0
+        if disk and self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".pkl"):
+                    try: os.remove(os.path.join(self.directory, name))
+                    except OSError: pass
+
+class TTLCache:
+    """In-process LRU of at most maxsize entries, each valid for ttl_s seconds."""
+    def __init__(self, maxsize: int = 64, ttl_s: float = 300):
+        self.maxsize, self.ttl_s = maxsize, ttl_s
+        self._mem: OrderedDict = OrderedDict()        # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key) -> tuple[bool, Any]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is None: return False, None
+            if time.time() - hit[0] > self.ttl_s:
+                del self._mem[key]
+                return False, None
+            self._mem.move_to_end(key)
+            return True, hit[1]
+
+    def put(self, key, val: Any):
+        with self._lock:
+            self._mem[key] = (time.time(), val); self._mem.move_to_end(key)
+            while len(self._mem) > self.maxsize:
+                self._mem.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def clear(self):
+        with self._lock: self._mem.clear()
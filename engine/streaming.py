@@ -0,0 +1,220 @@
+# streaming.py
+# Incremental counterparts of engine.indicators: each object keeps O(1) state and
+# update(bar) folds in one candle and returns the indicator value for that bar.
+# After warm-up the values match the batch functions run over the same bars
+# (NaN until the batch function's min_periods would be satisfied).
+# A bar is any mapping with "high", "low", "close", "volume" (dict, pandas row, ...).
+from __future__ import annotations
+from collections import deque
+import math
+import pandas as pd
+
+from engine.indicators import EPS
+
+NAN = float("nan")
+
+# ---------- Building blocks ----------
+class _Ewm:
+    """adjust=False EWM with min_periods, like Series.ewm(alpha=..., adjust=False, min_periods=n).
+    A NaN input leaves the value unchanged but keeps decaying its weight, as pandas does
+    with ignore_na=False: the next observation gets alpha / ((1-alpha)**k + alpha) after k steps."""
+    __slots__ = ("alpha", "min_periods", "y", "w", "count")
+
+    def __init__(self, alpha: float, min_periods: int):
+        self.alpha = alpha; self.min_periods = min_periods
+        self.y = NAN; self.w = 1.0; self.count = 0
+
+    def update(self, x: float) -> float:
+        if self.count == 0:    # pandas skips leading NaNs
+            if x == x: self.y = x; self.count = 1
+            return self.value
+        self.w *= 1 - self.alpha
+        if x == x:
+            if x != self.y: self.y = (self.w*self.y + self.alpha*x) / (self.w + self.alpha)
+            self.w = 1.0; self.count += 1
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.y if self.count >= self.min_periods else NAN
+
+class _RollingSum:
+    """Rolling sum with min_periods=n: NaN while a NaN is inside the window, like pandas."""
+    __slots__ = ("n", "buf", "s", "nans")
+
+    def __init__(self, n: int):
+        self.n = n; self.buf = deque(maxlen=n); self.s = 0.0; self.nans = 0
+
+    def update(self, x: float) -> float:
+        if len(self.buf) == self.n:
+            y = self.buf[0]
+            if y != y: self.nans -= 1
+            else: self.s -= y
+        self.buf.append(x)
+        if x != x: self.nans += 1
+        else: self.s += x
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.s if len(self.buf) == self.n and not self.nans else NAN
+
+class _RollingMoments:
+    """Rolling mean and sample std (ddof=1) via add/remove Welford updates over the
+    non-NaN values; NaN while a NaN is inside the window."""
+    __slots__ = ("n", "buf", "k", "nans", "mean", "m2")
+
+    def __init__(self, n: int):
+        self.n = n; self.buf = deque(maxlen=n); self.k = 0; self.nans = 0; self.mean = 0.0; self.m2 = 0.0
+
+    def update(self, x: float) -> tuple[float, float]:
+        if len(self.buf) == self.n:
+            y = self.buf[0]
+            if y != y:
+                self.nans -= 1
+            else:
+                self.k -= 1
+                if self.k == 0:
+                    self.mean = self.m2 = 0.0
+                else:
+                    d = y - self.mean; self.mean -= d/self.k; self.m2 -= d*(y - self.mean)
+        self.buf.append(x)
+        if x != x:
+            self.nans += 1
+        else:
+            self.k += 1
+            d = x - self.mean; self.mean += d/self.k; self.m2 += d*(x - self.mean)
+        if len(self.buf) < self.n or self.nans: return NAN, NAN
+        return self.mean, math.sqrt(max(self.m2, 0.0)/(self.k - 1))
+
+# ---------- Basics ----------
+class EMA:
+    def __init__(self, n: int, field: str = "close"):
+        self.field = field; self._e = _Ewm(2.0/(n+1), n)
+
+    def update(self, bar) -> float:
+        return self._e.update(float(bar[self.field]))
+
+class RSI:
+    def __init__(self, n: int = 14):
+        self.prev = None
+        self._up = _Ewm(1.0/n, n); self._dn = _Ewm(1.0/n, n)
+
+    def update(self, bar) -> float:
+        c = float(bar["close"])
+        if self.prev is not None:
+            d = c - self.prev
+            self._up.update(max(d, 0.0)); self._dn.update(max(-d, 0.0))
+        self.prev = c
+        au, ad = self._up.value, self._dn.value
+        return 100 - 100/(1 + au/(ad + EPS))
+
+class TrueRange:
+    def __init__(self):
+        self.prev_close = None
+
+    def update(self, bar) -> float:
+        h, l, c = float(bar["high"]), float(bar["low"]), float(bar["close"])
+        pc = self.prev_close; self.prev_close = c
+        if pc is None: return h - l
+        return max(h - l, abs(h - pc), abs(l - pc))
+
+class ATR:
+    def __init__(self, n: int = 14):
+        self._tr = TrueRange(); self._e = _Ewm(1.0/n, n)
+
+    def update(self, bar) -> float:
+        return self._e.update(self._tr.update(bar))
+
+# ---------- DI/ADX ----------
+class DIPlusMinus:
+    """Returns (plus_di, minus_di) per bar, like di_plus_minus."""
+    def __init__(self, n: int = 14):
+        self.prev = None
+        self._tr = TrueRange()
+        self._atr = _Ewm(1.0/n, n); self._p = _Ewm(1.0/n, n); self._m = _Ewm(1.0/n, n)
+
+    def update(self, bar) -> tuple[float, float]:
+        h, l = float(bar["high"]), float(bar["low"])
+        plus_dm = minus_dm = 0.0
+        if self.prev is not None:
+            up_move, down_move = h - self.prev[0], -(l - self.prev[1])
+            if up_move > down_move and up_move > 0: plus_dm = up_move
+            if down_move > up_move and down_move > 0: minus_dm = down_move
+        self.prev = (h, l)
+        a = self._atr.update(self._tr.update(bar))
+        return (100 * (self._p.update(plus_dm) / (a + EPS)),
+                100 * (self._m.update(minus_dm) / (a + EPS)))
+
+class ADX:
+    def __init__(self, n: int = 14):
+        self._di = DIPlusMinus(n); self._e = _Ewm(1.0/n, n)
+
+    def update(self, bar) -> float:
+        pdi, mdi = self._di.update(bar)
+        return self._e.update(100 * (abs(pdi - mdi) / (pdi + mdi + EPS)))
+
+# ---------- Channels & Bands ----------
+class Bollinger:
+    """Returns (mid, upper, lower, bandwidth, pct_b) per bar, like bollinger."""
+    def __init__(self, n: int = 20, k: float = 2.0):
+        self.k = k; self._mom = _RollingMoments(n)
+
+    def update(self, bar) -> tuple[float, float, float, float, float]:
+        c = float(bar["close"])
+        m, sd = self._mom.update(c)
+        upper, lower = m + self.k*sd, m - self.k*sd
+        return m, upper, lower, (upper - lower) / (abs(m) + EPS), (c - lower) / (upper - lower + EPS)
+
+class Keltner:
+    """Returns (mid, upper, lower) per bar, like keltner."""
+    def __init__(self, n: int = 20, m: float = 1.5):
+        self.m = m; self._mid = EMA(n); self._atr = ATR(n)
+
+    def update(self, bar) -> tuple[float, float, float]:
+        mid, a = self._mid.update(bar), self._atr.update(bar)
+        return mid, mid + self.m*a, mid - self.m*a
+
+# ---------- Volume & Flow ----------
+class OBV:
+    def __init__(self):
+        self.prev = None; self.total = 0.0
+
+    def update(self, bar) -> float:
+        c = float(bar["close"])
+        if self.prev is not None:
+            d = c - self.prev
+            self.total += float(bar["volume"]) * ((d > 0) - (d < 0))
+        self.prev = c
+        return self.total
+
+class CMF:
+    def __init__(self, n: int = 20):
+        self._mfv = _RollingSum(n); self._vol = _RollingSum(n)
+
+    def update(self, bar) -> float:
+        h, l, c, v = float(bar["high"]), float(bar["low"]), float(bar["close"]), float(bar["volume"])
+        mf_mult = ((c - l) - (h - c)) / (h - l + EPS)
+        return self._mfv.update(mf_mult * v) / (self._vol.update(v) + EPS)
+
+class MFI:
+    def __init__(self, n: int = 14):
+        self.prev_tp = None
+        self._pos = _RollingSum(n); self._neg = _RollingSum(n)
+
+    def update(self, bar) -> float:
+        tp = (float(bar["high"]) + float(bar["low"]) + float(bar["close"])) / 3.0
+        mf = tp * float(bar["volume"])
+        pos = neg = 0.0
+        if self.prev_tp is not None:
+            d = tp - self.prev_tp
+            if d >= 0: pos = mf
+            elif d < 0: neg = mf          # NaN change (a NaN bar either side): neither
+        self.prev_tp = tp
+        mr = self._pos.update(pos) / (self._neg.update(neg) + EPS)
+        return 100 - (100 / (1 + mr))
+
+# ---------- Helpers ----------
+def replay(indicator, df: pd.DataFrame) -> list:
+    """Feed every row of df through indicator.update and return the per-bar outputs."""
+    return [indicator.update(bar) for bar in df.to_dict("records")]
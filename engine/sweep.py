@@ -0,0 +1,139 @@
+# sweep.py
+# Parameter sweeps over run_backtest. Parameters are dotted paths into the Plan,
+# e.g. "weighting.coeffs.trend", "rebalance.band_pp", "rebalance.turnover_max",
+# "risk.max_weight". Market data is loaded once; each worker process receives it
+# once (inherited on fork, or via the pool initializer elsewhere) together with the
+# precomputed indicator panels, and tasks only carry their parameter dict.
+#
+# CLI:  python -m engine.sweep --plan plan.json --grid grid.json [--samples 200] [--workers 8]
+#   grid.json: {"rebalance.band_pp": [2, 5, 8], "risk.max_weight": [0.3, 0.4]}
+#   with --samples, [lo, hi] pairs of numbers are sampled uniformly, other lists by choice.
+from __future__ import annotations
+import argparse, copy, itertools, json, multiprocessing as mp, os, random, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+import pandas as pd
+
+from engine.engine import Plan
+from engine.backtest import run_backtest
+
+STAT_COLS = ["Sharpe", "Sortino", "Calmar", "CAGR_est", "MaxDD", "MaxDDDuration", "CurrentDDDuration",
+             "TotalReturn", "Vol", "HitRate", "Exposure", "Turnover"]
+
+# ---------- Parameter sets ----------
+def expand_grid(grid: Dict[str, list]) -> List[dict]:
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+def sample_params(space: Dict[str, list], n: int, seed: int = 0) -> List[dict]:
+    """n random parameter sets: [lo, hi] numeric pairs are uniform ranges, other lists are choices."""
+    rng = random.Random(seed)
+    def draw(v):
+        if len(v) == 2 and all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in v):
+            return rng.uniform(v[0], v[1])
+        return rng.choice(v)
+    return [{k: draw(v) for k, v in space.items()} for _ in range(n)]
+
+def apply_params(plan: Plan, params: dict) -> Plan:
+    p = copy.deepcopy(plan)
+    for path, val in params.items():
+        head, *rest = path.split(".")
+        if not rest:
+            setattr(p, head, val); continue
+        node = getattr(p, head)
+        for k in rest[:-1]:
+            node = node.setdefault(k, {})
+        node[rest[-1]] = val
+    return p
+
+# ---------- Workers ----------
+_SHARED: dict = {}
+
+def _init_worker(shared: dict):
+    _SHARED.clear(); _SHARED.update(shared)
+
+def map_shared(fn, n: int, shared: dict, workers: int | None = None) -> list:
+    """[fn(i) for i in range(n)] across worker processes that all see `shared` as _SHARED.
+    The parent's _SHARED is cleared again on return, so the data is not kept alive."""
+    workers = workers or os.cpu_count() or 1
+    try:
+        if workers <= 1 or n <= 1:
+            _init_worker(shared)
+            return [fn(i) for i in range(n)]
+        if "fork" in mp.get_all_start_methods():
+            # children inherit _SHARED from the parent's memory; nothing is pickled
+            _init_worker(shared)
+            ex = ProcessPoolExecutor(workers, mp_context=mp.get_context("fork"))
+        else:
+            ex = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(shared,))
+        with ex:
+            return list(ex.map(fn, range(n), chunksize=max(1, n // (workers * 4))))
+    finally:
+        _SHARED.clear()
+
+def _run_one(i: int) -> tuple[int, dict]:
+    s = _SHARED
+    plan = apply_params(s["plan"], s["params"][i])
+    try:
+        _, stats = run_backtest(plan, s["ohlcv"], s["sentiment"], start=s["start"], end=s["end"],
+                                vectorized=s["vectorized"], panels=s["panels"])
+    except Exception as e:
+        stats = {"error": str(e)}
+    return i, stats
+
+def run_sweep(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+              params: List[dict], start=None, end=None, workers: int | None = None,
+              vectorized: bool = True, rank_by: str = "Sharpe") -> pd.DataFrame:
+    """Backtest every parameter set and return one row per set (params + stats), best first."""
+    shared = {"plan": plan, "ohlcv": ohlcv, "sentiment": sentiment, "params": params,
+              "start": start, "end": end, "vectorized": vectorized, "panels": None}
+    if vectorized:
+        from engine.vectorized import build_panels
+        shared["panels"] = build_panels(ohlcv)    # built once, shipped with the data
+    results = map_shared(_run_one, len(params), shared, workers)
+    rows = [{**params[i], **stats} for i, stats in results]
+    table = pd.DataFrame(rows)
+    if rank_by in table.columns:
+        table = table.sort_values(rank_by, ascending=False, na_position="last").reset_index(drop=True)
+    return table
+
+# ---------- CLI ----------
+def _load_data(plan_json: dict, days: int):
+    from services.data.data_layer import load_universe
+    from services.data.sentiment import fetch_headlines, rolling_sentiment
+    ohlcv = load_universe(plan_json["universe_list"], since_days=days)
+    cp = fetch_headlines(os.getenv("CP_AUTH_TOKEN"))
+    sent = rolling_sentiment(cp) if isinstance(cp, pd.DataFrame) and not cp.empty else {}
+    return ohlcv, sent
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Parameter sweep over run_backtest")
+    ap.add_argument("--plan", required=True, help="plan JSON file")
+    ap.add_argument("--grid", required=True, help="JSON {dotted.param: [values]}")
+    ap.add_argument("--samples", type=int, default=0, help="random samples instead of the full grid")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--days", type=int, default=540)
+    ap.add_argument("--start"); ap.add_argument("--end")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--rank-by", default="Sharpe")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", help="write the full table to this CSV")
+    args = ap.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    with open(args.plan) as f: plan_json = json.load(f)
+    with open(args.grid) as f: grid = json.load(f)
+    params = sample_params(grid, args.samples, args.seed) if args.samples else expand_grid(grid)
+    ohlcv, sent = _load_data(plan_json, args.days)
+
+    t0 = time.perf_counter()
+    table = run_sweep(Plan.from_dict(plan_json), ohlcv, sent, params, start=args.start, end=args.end,
+                      workers=args.workers, rank_by=args.rank_by)
+    print(f"{len(params)} backtests in {time.perf_counter()-t0:.1f}s")
+    cols = [c for c in table.columns if c not in STAT_COLS] + [c for c in STAT_COLS if c in table.columns]
+    print(table[cols].head(args.top).to_string())
+    if args.out: table.to_csv(args.out, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# vectorized.py
+# Precomputed indicator panels for run_backtest(vectorized=True).
+#
+# The loop backtest scores each rebalance date on ohlcv[a].loc[:t].iloc[-250:], so
+# every EWM-based indicator restarts at the window's first bar. For an adjust=False
+# EWM y_t = b*y_{t-1} + a*x_t that restart is a closed-form correction of the
+# full-history series:  y_win[t] = y[t] - b**(t-p) * (y[p] - x_win[p]),  with p the
+# window's first valid bar. Rolling indicators (SMA, Donchian, Bollinger) do not
+# depend on the window start at all. So every series is computed once per asset
+# and each rebalance only reads a few array slots. The restart itself is
+# engine.indicators.ewm_restart, shared with the windowed rule indicators.
+from __future__ import annotations
+from typing import Dict
+import numpy as np
+import pandas as pd
+
+from engine.indicators import EPS, true_range, ewm_raw, ewm_restart
+from engine.engine import (
+    Plan, compile_rules, infer_plan_template, template_at, _trend_from, _momentum_from,
+    _volume_from, _breakout_from, _composite_from, _tilted_score, _cap_weights
+)
+from services.planner.regime import regime_from, map_regime_to_template
+
+WINDOW = 250
+
+def _ewm_dot(x: np.ndarray, q: int, e: int, alpha: float) -> float:
+    # adjust=False EWM of x started at q, evaluated at e
+    k = e - q
+    w = alpha * (1 - alpha) ** np.arange(k, -1, -1)
+    w[0] = (1 - alpha) ** k
+    return float(w @ x[q:e+1])
+
+class IndicatorPanel:
+    """Full-history indicator arrays for one asset, readable as of any rebalance window."""
+
+    def __init__(self, df: pd.DataFrame, window: int = WINDOW):
+        self.df = df
+        self.window = window
+        self.index = df.index
+        self.c = df["close"].to_numpy(dtype=float)
+        self.h = df["high"].to_numpy(dtype=float)
+        self.l = df["low"].to_numpy(dtype=float)
+        self.v = df["volume"].to_numpy(dtype=float)
+        self.tr = true_range(df["high"], df["low"], df["close"]).to_numpy()
+        self.tr_first = self.h - self.l            # TR at a window's first bar (no prev close)
+        up_move = np.diff(self.h, prepend=np.nan)
+        down_move = -np.diff(self.l, prepend=np.nan)
+        self.pdm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+        self.mdm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+        c = df["close"]; h = df["high"]; l = df["low"]
+        self.vol_sma20 = df["volume"].rolling(20, min_periods=20).mean().to_numpy()
+        self.d_hi = h.rolling(20, min_periods=20).max().to_numpy()
+        self.d_lo = l.rolling(20, min_periods=20).min().to_numpy()
+        m = c.rolling(20, min_periods=20).mean()
+        sd = c.rolling(20, min_periods=20).std()
+        upper, lower = m + 2*sd, m - 2*sd
+        self.bw = ((upper - lower) / (m.abs() + EPS)).to_numpy()
+        self._ewm: Dict[tuple, np.ndarray] = {}
+
+    # ---------- window bookkeeping ----------
+    def locate(self, t) -> tuple[int, int]:
+        """Return (start, last) positions of the loc[:t].iloc[-window:] slice; last=-1 if empty."""
+        end = int(self.index.searchsorted(t, side="right"))
+        return max(0, end - self.window), end - 1
+
+    def _raw(self, key: str, alpha: float) -> np.ndarray:
+        k = (key, alpha)
+        if k not in self._ewm:
+            src = {"close": self.c, "tr": self.tr, "pdm": self.pdm, "mdm": self.mdm}[key]
+            self._ewm[k] = ewm_raw(src, alpha)
+        return self._ewm[k]
+
+    def _win_ewm(self, key: str, alpha: float, s: int, j: int, first: float) -> float:
+        y = self._raw(key, alpha)
+        return ewm_restart(y[j], y[s], first, alpha, j - s)
+
+    @staticmethod
+    def _at(arr: np.ndarray, s: int, j: int, n: int) -> float:
+        return arr[j] if j - s + 1 >= n else np.nan
+
+    # ---------- windowed indicators ----------
+    def ema(self, n: int, s: int, j: int) -> float:
+        if j < s or j - s + 1 < n: return np.nan
+        return self._win_ewm("close", 2.0/(n+1), s, j, self.c[s])
+
+    def atr(self, n: int, s: int, j: int) -> float:
+        if j - s + 1 < n: return np.nan
+        return self._win_ewm("tr", 1.0/n, s, j, self.tr_first[s])
+
+    def adx_tail(self, n: int, s: int, j: int, count: int) -> np.ndarray:
+        """ADX(n) of the window [s, j] evaluated at its last `count` bars."""
+        alpha = 1.0/n
+        k = np.arange(j - s + 1)
+        te, pe, me = self._raw("tr", alpha), self._raw("pdm", alpha), self._raw("mdm", alpha)
+        atr_n = ewm_restart(te[s:j+1], te[s], self.tr_first[s], alpha, k)
+        pdi = 100 * (ewm_restart(pe[s:j+1], pe[s], 0.0, alpha, k) / (atr_n + EPS))   # DM is 0 on a window's first bar
+        mdi = 100 * (ewm_restart(me[s:j+1], me[s], 0.0, alpha, k) / (atr_n + EPS))
+        dx = 100 * (np.abs(pdi - mdi) / (pdi + mdi + EPS))
+        q = n - 1                                                     # first bar with a valid DI
+        out = np.full(count, np.nan)
+        for i, e in enumerate(range(j - s - count + 1, j - s + 1)):
+            if e >= 0 and e - q + 1 >= n:
+                out[i] = _ewm_dot(dx, q, e, alpha)
+        return out
+
+    # ---------- scores ----------
+    def composite(self, coeffs: dict, sent_val: float, template: str, s: int, j: int) -> float:
+        ema50 = self.ema(50, s, j)
+        ema50_lag5 = self.ema(50, s, j - 5)
+        sc_trend = _trend_from(self.adx_tail(14, s, j, 1)[-1], ema50, self.ema(200, s, j), ema50_lag5)
+        n = j - s + 1
+        sc_momo = _momentum_from(n, self.c[j], self.c[j-60] if n > 60 else np.nan)
+        sc_vol = _volume_from(self.v[j], self._at(self.vol_sma20, s, j, 20))
+        sc_extra = 0.0
+        if template == "breakout_up":
+            sc_extra = 0.5*_breakout_from(self.c[j], self._at(self.d_hi, s, j, 20), self.atr(14, s, j))
+        return _composite_from(coeffs, sc_trend, sc_momo, sc_vol, sent_val, sc_extra)
+
+    def regime(self, s: int, j: int) -> str:
+        adx6 = self.adx_tail(14, s, j, min(6, j - s + 1))
+        adx_rising = int((np.diff(adx6) > 0).sum()) >= 3
+        vol_surge = self.v[j] > 1.5 * self._at(self.vol_sma20, s, j, 20)
+        bw_win = self.bw[s+19:j+1]
+        bw_q30 = float(np.quantile(bw_win, 0.30)) if len(bw_win) else np.nan
+        macd_line = self.ema(12, s, j) - self.ema(26, s, j)
+        return regime_from(self.c[j], adx6[-1], adx_rising, vol_surge, self._at(self.bw, s, j, 20), bw_q30,
+                           self._at(self.d_hi, s, j, 20), self._at(self.d_lo, s, j, 20),
+                           self.ema(50, s, j), self.ema(200, s, j), macd_line)
+
+def build_panels(ohlcv: Dict[str,pd.DataFrame], window: int = WINDOW) -> Dict[str,IndicatorPanel]:
+    return {a: IndicatorPanel(df, window) for a, df in ohlcv.items()}
+
+class VectorizedWeights:
+    """Drop-in for target_weights(...)[0] over rolling windows, backed by IndicatorPanels.
+
+    Calling the object with a timestamp t returns the weights the loop backtest gets
+    from target_weights(plan, {a: df.loc[:t].iloc[-window:]}, {a: sent.loc[:t]}).
+    """
+
+    def __init__(self, plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+                 window: int = WINDOW, panels: Dict[str,IndicatorPanel] | None = None,
+                 regimes: Dict[str,pd.Series] | None = None):
+        self.plan = plan
+        self.regimes = regimes      # whole-history regime_series; replaces per-window voting
+        self.sentiment = sentiment
+        # panels only depend on the bars, so sweeps can build them once and share them
+        self.panels = panels if panels is not None else build_panels(ohlcv, window)
+        self.rules = compile_rules(tuple(plan.custom_rules)) if plan.custom_rules else None
+        self.gates = ({a: self.rules.signal(df, window=window).to_numpy() for a, df in ohlcv.items()}
+                      if self.rules else {})
+
+    def _sent_at(self, a: str, t) -> float:
+        s = self.sentiment.get(a)
+        if s is None: return 0.0
+        k = int(s.index.searchsorted(t, side="right"))
+        return float(s.iloc[k-1]) if k > 0 else 0.0
+
+    def _template(self, t, windows: dict) -> str:
+        if self.plan.regime != "auto":
+            return infer_plan_template(self.plan, {})
+        if self.regimes is not None:
+            return template_at(self.plan, self.regimes, t)
+        votes = {}
+        for a, (s, j) in windows.items():
+            r = self.panels[a].regime(s, j)
+            votes[r] = votes.get(r,0)+1
+        reg = max(votes.items(), key=lambda x:x[1])[0] if votes else "other"
+        return map_regime_to_template(reg)
+
+    def __call__(self, t) -> Dict[str,float]:
+        plan = self.plan
+        windows = {a: p.locate(t) for a, p in self.panels.items()}
+        template = self._template(t, windows)
+        coeffs   = plan.weighting.get("coeffs", {"trend":0.35,"momentum":0.35,"volume":0.15,"sentiment":0.15})
+        good     = plan.sentiment_cfg.get("good_threshold", 0.30)
+        bad      = plan.sentiment_cfg.get("bad_threshold", -0.30)
+        tilt_pct = plan.weighting.get("tilt_sentiment_pct", 0.10)
+
+        weights = {}
+        for a, (s, j) in windows.items():
+            p = self.panels[a]
+            s_val = self._sent_at(a, t)
+            sentiment_ok = (s_val >= good) if plan.gates.get("sentiment","AUTO") in ("AUTO","GOOD") else True
+            if self.rules:
+                if not (self.gates[a][j] and (sentiment_ok or not self.rules.needs_sentiment)):
+                    continue
+            base = p.composite(coeffs, s_val, template, s, j)
+            weights[a] = _tilted_score(plan, base, s_val, good, bad, tilt_pct)
+        return _cap_weights(plan, weights)
+
+def parity_report(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+                  dates) -> dict:
+    """Compare VectorizedWeights against the target_weights loop on the given dates."""
+    from engine.engine import target_weights
+    vw = VectorizedWeights(plan, ohlcv, sentiment)
+    max_diff, mismatched = 0.0, []
+    for t in dates:
+        ref, _ = target_weights(plan, {a: df.loc[:t].iloc[-WINDOW:] for a, df in ohlcv.items()},
+                                {a: (sentiment.get(a).loc[:t] if a in sentiment else None) for a in ohlcv}, explain=False)
+        got = vw(t)
+        if set(ref) != set(got):
+            mismatched.append(t); continue
+        for a in ref:
+            max_diff = max(max_diff, abs(ref[a] - got[a]))
+    return {"dates": len(dates), "mismatched_dates": mismatched, "max_abs_diff": max_diff}
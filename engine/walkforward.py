@@ -0,0 +1,93 @@
+# walkforward.py
+# Walk-forward optimization: the aligned index is cut into rolling in-sample /
+# out-of-sample windows; in each window every parameter set is backtested on the
+# in-sample bars, the best one (by rank_by) is run on the following out-of-sample
+# bars, and the out-of-sample equity curves are chained into one curve.
+#
+# Windows run in parallel (engine.sweep.map_shared). Indicator panels are built once
+# over the full history and shared by every window: run_backtest(start, end) still
+# scores each rebalance on bars up to t only, so there is no look-ahead.
+from __future__ import annotations
+from typing import Dict, List
+import pandas as pd
+
+from engine.engine import Plan
+from engine.backtest import run_backtest, equity_stats
+from engine.sweep import _SHARED, apply_params, map_shared
+
+def aligned_index(ohlcv: Dict[str,pd.DataFrame]) -> pd.DatetimeIndex:
+    idx = None
+    for df in ohlcv.values():
+        idx = df.index if idx is None else idx.intersection(df.index)
+    return idx
+
+def walk_forward_windows(idx: pd.DatetimeIndex, is_bars: int, oos_bars: int,
+                         step: int | None = None, anchored: bool = False) -> List[dict]:
+    """Rolling (or anchored, expanding in-sample) windows as start/end timestamps."""
+    step = step or oos_bars
+    out = []
+    for i in range(0, len(idx) - is_bars - oos_bars + 1, step):
+        s = 0 if anchored else i
+        out.append({"is_start": idx[s], "is_end": idx[i+is_bars-1],
+                    "oos_start": idx[i+is_bars], "oos_end": idx[i+is_bars+oos_bars-1]})
+    return out
+
+def _score(stats: dict, rank_by: str) -> float:
+    v = stats.get(rank_by)
+    return float(v) if v is not None and v == v else float("-inf")
+
+def _run_window(k: int) -> tuple[int, dict, pd.DataFrame | None]:
+    s = _SHARED
+    w = s["windows"][k]
+    best, best_score = None, float("-inf")
+    for i, params in enumerate(s["params"]):
+        try:
+            _, stats = run_backtest(apply_params(s["plan"], params), s["ohlcv"], s["sentiment"],
+                                    start=w["is_start"], end=w["is_end"],
+                                    vectorized=s["vectorized"], panels=s["panels"])
+        except Exception:
+            continue
+        sc = _score(stats, s["rank_by"])
+        if best is None or sc > best_score:
+            best, best_score = i, sc
+    row = {**w, "best": best, "is_score": best_score}
+    if best is None:
+        return k, row, None
+    ec, stats = run_backtest(apply_params(s["plan"], s["params"][best]), s["ohlcv"], s["sentiment"],
+                             start=w["oos_start"], end=w["oos_end"],
+                             vectorized=s["vectorized"], panels=s["panels"])
+    row.update({"params": s["params"][best], **{f"oos_{m}": v for m, v in stats.items()}})
+    return k, row, (ec if "error" not in stats else None)
+
+def stitch_equity(curves: List[pd.DataFrame], value: float = 1_000_000.0) -> pd.DataFrame:
+    """Chain equity curves: each segment is rescaled to start where the previous one ended."""
+    parts = []
+    for ec in curves:
+        if ec is None or ec.empty: continue
+        seg = ec["equity"] / ec["equity"].iloc[0] * value
+        if parts: seg = seg[seg.index > parts[-1].index[-1]]
+        if seg.empty: continue
+        parts.append(seg); value = float(seg.iloc[-1])
+    if not parts:
+        return pd.DataFrame(columns=["equity"])
+    return pd.concat(parts).to_frame("equity")
+
+def walk_forward(plan: Plan, ohlcv: Dict[str,pd.DataFrame], sentiment: Dict[str,pd.Series],
+                 params: List[dict], is_bars: int = 180, oos_bars: int = 60, step: int | None = None,
+                 anchored: bool = False, workers: int | None = None, vectorized: bool = True,
+                 rank_by: str = "Sharpe") -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """Returns (stitched out-of-sample equity, per-window table, stats of the stitched curve).
+    oos_bars must be >= 60, the minimum run_backtest simulates."""
+    windows = walk_forward_windows(aligned_index(ohlcv), is_bars, oos_bars, step, anchored)
+    if not windows or not params:
+        return pd.DataFrame(columns=["equity"]), pd.DataFrame(), {"error":"not enough data"}
+    shared = {"plan": plan, "ohlcv": ohlcv, "sentiment": sentiment, "params": params, "windows": windows,
+              "vectorized": vectorized, "rank_by": rank_by, "panels": None}
+    if vectorized:
+        from engine.vectorized import build_panels
+        shared["panels"] = build_panels(ohlcv)    # full history, reused by every window
+    results = sorted(map_shared(_run_window, len(windows), shared, workers), key=lambda r: r[0])
+    table = pd.DataFrame([row for _, row, _ in results])
+    ec = stitch_equity([c for _, _, c in results])
+    stats = equity_stats(ec) if len(ec) > 1 else {"error":"no out-of-sample results"}
+    return ec, table, stats
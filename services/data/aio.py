@@ -0,0 +1,66 @@
+# aio.py
+# Helpers for the async data path: bounded concurrent gather and a sync entry point.
+# run_sync() executes coroutines on one long-lived background event loop, so the
+# async clients bound to it (services.data.exchanges) keep their connection pools
+# and rate-limit state between calls. It works from plain threads (FastAPI sync
+# endpoints, scripts) and from code running inside another event loop; the caller's
+# contextvars (e.g. the profiler) carry over into the coroutine. Modules that keep
+# clients on that loop register a closer, run once at interpreter exit.
+from __future__ import annotations
+import asyncio, atexit, contextvars, threading
+from typing import Awaitable, Iterable
+
+DEFAULT_CONCURRENCY = 16
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+_closers: list = []                   # async fn(loop) closing what a module keeps on `loop`
+
+async def bounded_gather(aws: Iterable[Awaitable], limit: int = DEFAULT_CONCURRENCY) -> list:
+    """asyncio.gather with at most `limit` awaitables running at once; results keep input order."""
+    sem = asyncio.Semaphore(max(1, limit))
+    async def one(aw):
+        async with sem:
+            return await aw
+    return await asyncio.gather(*(one(aw) for aw in aws))
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="data-aio", daemon=True).start()
+        return _loop
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and wait for its result."""
+    loop = background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync() called from the data loop; await the coroutine instead")
+    ctx = contextvars.copy_context()
+    async def in_caller_context():
+        return await asyncio.create_task(coro, context=ctx)
+    return asyncio.run_coroutine_threadsafe(in_caller_context(), loop).result()
+
+def register_closer(fn):
+    _closers.append(fn)
+    return fn
+
+@atexit.register
+def _shutdown():
+    loop = _loop
+    if loop is None or not loop.is_running(): return
+    async def close_all():
+        for fn in _closers:
+            try:
+                await fn(loop)
+            except Exception:
+                pass
+    try:
+        asyncio.run_coroutine_threadsafe(close_all(), loop).result(timeout=5)
+    except Exception:
+        pass
@@ -0,0 +1,271 @@
+# bar_store.py
+# Local OHLCV store for the ccxt loaders. One directory per (exchange, symbol, timeframe):
+#     <dir>/<exchange>/<BASE-QUOTE>_<tf>/<first_ms>_<seq>.npy   float64 (6, n): t_ms, open, high, low, close, volume
+#     <dir>/<exchange>/<BASE-QUOTE>_<tf>/meta.json             {"from_ms": earliest requested, "fetched_ms", "seq"}
+# Rows are columns of C-ordered segments, so np.load(mmap_mode="r") pages in only the
+# columns and range being read. A load only asks the exchange for
+#   - bars newer than the last stored one (starting at it: it may have been still forming),
+#   - bars before the stored range when a longer history is requested,
+#   - the whole requested window (up to max_rows) when the stored bars end before it
+#     starts; the stale bars are dropped rather than walked forward page by page,
+# and serves everything else from disk. The latest bar is re-fetched at most every
+# refresh_s seconds while it is still open. Fetched rows are written as a new segment;
+# segments are read in (first_ms, seq) order and a later one replaces the bars it
+# overlaps. Past MAX_SEGMENTS segments, or max_bars by a quarter, a key is compacted into
+# one segment holding its newest max_bars bars. load() fetches with a sync ccxt
+# exchange, aload() with a ccxt.async_support one; both re-read the key under a lock
+# before appending, so concurrent writers of the same key never drop each other's bars.
+#
+# OHLCV_STORE_DIR overrides the directory (default .cache/ohlcv); set it to an empty
+# string to disable the store. OHLCV_STORE_REFRESH_S overrides refresh_s (default 60),
+# OHLCV_STORE_MAX_BARS max_bars (default 500000 per key).
+from __future__ import annotations
+import json, os, re, tempfile, threading, time
+from typing import Callable, List
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+_TF_UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+def timeframe_ms(timeframe: str) -> int:
+    m = re.fullmatch(r"(\d+)([mhdw])", timeframe)
+    if not m: raise ValueError(f"unsupported timeframe {timeframe!r}")
+    return int(m.group(1)) * _TF_UNIT_MS[m.group(2)]
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _exchange(exchange_id: str):
+    from services.data.exchanges import exchange
+    return exchange(exchange_id)
+
+async def _async_exchange(exchange_id: str):
+    from services.data.exchanges import async_exchange
+    return await async_exchange(exchange_id)
+
+def fetch_rows(ex, pair: str, timeframe: str, since_ms: int, until_ms: int | None = None,
+               max_rows: int | None = None, page: int = 1000) -> list:
+    """Page through ex.fetch_ohlcv from since_ms until the exchange runs out of bars,
+    the last bar passes until_ms, or max_rows rows have been collected. Pages are
+    spaced by the client's own rate limiter (enableRateLimit)."""
+    rows = []
+    while True:
+        batch = ex.fetch_ohlcv(pair, timeframe=timeframe, since=since_ms, limit=page)
+        if not batch: break
+        rows += batch
+        since_ms = batch[-1][0] + 1
+        if len(batch) < page: break
+        if until_ms is not None and since_ms > until_ms: break
+        if max_rows and len(rows) >= max_rows: break
+    return rows
+
+async def afetch_rows(ex, pair: str, timeframe: str, since_ms: int, until_ms: int | None = None,
+                      max_rows: int | None = None, page: int = 1000) -> list:
+    """fetch_rows for a ccxt.async_support exchange."""
+    rows = []
+    while True:
+        batch = await ex.fetch_ohlcv(pair, timeframe=timeframe, since=since_ms, limit=page)
+        if not batch: break
+        rows += batch
+        since_ms = batch[-1][0] + 1
+        if len(batch) < page: break
+        if until_ms is not None and since_ms > until_ms: break
+        if max_rows and len(rows) >= max_rows: break
+    return rows
+
+def to_frame(bars: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame(bars[1:].T, columns=COLUMNS, index=pd.Index(bars[0].astype("int64"), name="t"))
+    df.index = pd.to_datetime(df.index, unit="ms", utc=True)
+    return df
+
+def _rows(rows: list) -> np.ndarray:
+    """(6, n) array of ccxt rows in time order; a repeated timestamp keeps its last row."""
+    a = np.asarray(rows, dtype=float).reshape(-1, 6).T
+    if a.shape[1] > 1 and not (np.diff(a[0]) > 0).all():
+        a = a[:, np.argsort(a[0], kind="stable")]
+        a = a[:, np.append(a[0, 1:] != a[0, :-1], True)]
+    return np.ascontiguousarray(a)
+
+def _combine(segments: list) -> np.ndarray:
+    # segments in (first_ms, seq) order: each one cuts the bars before it that it overlaps
+    out: list = []
+    for seg in segments:
+        while out and out[-1][0, -1] >= seg[0, 0]:
+            prev = out.pop()
+            k = int(np.searchsorted(prev[0], seg[0, 0]))
+            if k:
+                out.append(prev[:, :k]); break
+        out.append(seg)
+    if len(out) == 1: return out[0]
+    return np.concatenate(out, axis=1) if out else np.empty((6, 0))
+
+MAX_SEGMENTS = 16
+
+class BarStore:
+    def __init__(self, directory: str | None = None, refresh_s: float | None = None,
+                 exchange_factory: Callable = _exchange, async_exchange_factory: Callable = _async_exchange,
+                 max_bars: int | None = None):
+        if directory is None:
+            directory = os.getenv("OHLCV_STORE_DIR", os.path.join(".cache", "ohlcv"))
+        self.directory = directory or None
+        self.refresh_s = float(os.getenv("OHLCV_STORE_REFRESH_S", 60) if refresh_s is None else refresh_s)
+        self.max_bars = int(os.getenv("OHLCV_STORE_MAX_BARS", 500_000) if max_bars is None else max_bars)
+        self.exchange_factory = exchange_factory
+        self.async_exchange_factory = async_exchange_factory
+        self._locks: dict = {}
+        self._guard = threading.Lock()
+
+    # ---------- Files ----------
+    def path(self, exchange_id: str, pair: str, timeframe: str) -> str:
+        name = re.sub(r"[^A-Za-z0-9.]+", "-", pair).strip("-")
+        return os.path.join(self.directory, exchange_id, f"{name}_{timeframe}")
+
+    def _lock(self, path: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    @staticmethod
+    def _segments(path: str) -> List[str]:
+        try:
+            return sorted(n for n in os.listdir(path) if n.endswith(".npy"))   # zero-padded: (first_ms, seq) order
+        except OSError:
+            return []
+
+    @classmethod
+    def _read_dir(cls, path: str) -> tuple[np.ndarray, dict, int]:
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return np.empty((6, 0)), {}, 0
+        for _ in range(3):                                   # a compaction may remove a listed segment
+            names = cls._segments(path)
+            try:
+                segs = [np.load(os.path.join(path, n), mmap_mode="r") for n in names]
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                break
+            return _combine([s for s in segs if s.shape[1]]), meta, len(names)
+        return np.empty((6, 0)), {}, 0
+
+    def read(self, exchange_id: str, pair: str, timeframe: str) -> tuple[np.ndarray, dict]:
+        """((6, N) bars, memory-mapped when a single segment, meta); an empty array and {} when nothing is stored."""
+        bars, meta, _ = self._read_dir(self.path(exchange_id, pair, timeframe))
+        return bars, meta
+
+    @staticmethod
+    def _dump(path: str, name: str, dump: Callable):
+        fd, tmp = tempfile.mkstemp(dir=path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            dump(f)
+        os.replace(tmp, os.path.join(path, name))             # atomic: readers never see half a file
+
+    def _append(self, path: str, seg: np.ndarray, seq: int) -> str:
+        name = f"{int(seg[0, 0]):015d}_{seq:08d}.npy"
+        self._dump(path, name, lambda f: np.save(f, seg))
+        return name
+
+    # ---------- Incremental fetch ----------
+    def _plan(self, exchange_id: str, pair: str, timeframe: str, since_ms: int):
+        # (stored bars, head fetch end or None, tail fetch start or None); the stored bars
+        # come back empty when they end before the window: the window is fetched whole
+        step, now = timeframe_ms(timeframe), _now_ms()
+        bars, meta = self.read(exchange_id, pair, timeframe)
+        if not bars.shape[1] or bars[0, -1] < since_ms - step:
+            return np.empty((6, 0)), None, since_ms
+        head = int(bars[0, 0]) - 1 if since_ms < meta.get("from_ms", since_ms) else None
+        stale = bars[0, -1] + step <= now or now - meta.get("fetched_ms", 0) > self.refresh_s*1000
+        return bars, head, int(bars[0, -1]) if stale else None
+
+    def _commit(self, exchange_id: str, pair: str, timeframe: str, rows: list, since_ms: int) -> np.ndarray:
+        path, new = self.path(exchange_id, pair, timeframe), _rows(rows)
+        with self._lock(path):
+            os.makedirs(path, exist_ok=True)
+            bars, meta, nseg = self._read_dir(path)
+            seq = meta.get("seq", 0)
+            if not bars.shape[1] or bars[0, -1] < since_ms - timeframe_ms(timeframe):
+                old, keep, seq = self._segments(path), new[:, -self.max_bars:], seq + 1
+                from_ms = int(keep[0, 0]) if keep.shape[1] < new.shape[1] else since_ms
+                if keep.shape[1]: self._append(path, keep, seq)
+                for name in old: os.remove(os.path.join(path, name))
+                bars = new
+            else:
+                from_ms = min(since_ms, meta.get("from_ms", since_ms))
+                head = new[:, new[0] < bars[0, 0]]           # closed bars already stored are not rewritten
+                tail = new[:, new[0] >= bars[0, -1]]
+                for seg in (head, tail):
+                    if seg.shape[1]:
+                        seq += 1; nseg += 1; self._append(path, seg, seq)
+                k = int(np.searchsorted(bars[0], tail[0, 0])) if tail.shape[1] else bars.shape[1]
+                bars = np.concatenate([head, bars[:, :k], tail], axis=1) if head.shape[1] or tail.shape[1] else bars
+                if nseg > MAX_SEGMENTS or bars.shape[1] > self.max_bars * 1.25:
+                    keep = np.ascontiguousarray(bars[:, -self.max_bars:])   # the caller still gets all of `bars`
+                    if keep.shape[1] < bars.shape[1]: from_ms = int(keep[0, 0])
+                    old, seq = self._segments(path), seq + 1
+                    name = self._append(path, keep, seq)
+                    for n in old:
+                        if n != name: os.remove(os.path.join(path, n))
+            meta = {"from_ms": from_ms, "fetched_ms": _now_ms(), "seq": seq}
+            self._dump(path, "meta.json", lambda f: f.write(json.dumps(meta).encode()))
+        return bars
+
+    @staticmethod
+    def _slice(bars: np.ndarray, since_ms: int) -> pd.DataFrame:
+        return to_frame(np.array(bars[:, int(np.searchsorted(bars[0], since_ms)):]))
+
+    # ---------- Public API ----------
+    def load(self, exchange_id: str, pair: str, timeframe: str, since_ms: int, max_rows: int | None = None) -> pd.DataFrame:
+        """Bars from since_ms to now, fetching only what the store does not hold yet."""
+        if not self.directory:
+            return to_frame(_rows(fetch_rows(self.exchange_factory(exchange_id), pair, timeframe, since_ms, max_rows=max_rows)))
+        bars, head, tail = self._plan(exchange_id, pair, timeframe, since_ms)
+        if head is None and tail is None:
+            return self._slice(bars, since_ms)
+        try:
+            ex = self.exchange_factory(exchange_id)
+            rows = fetch_rows(ex, pair, timeframe, since_ms, until_ms=head) if head is not None else []
+            if tail is not None:
+                rows += fetch_rows(ex, pair, timeframe, tail, max_rows=None if bars.shape[1] else max_rows)
+        except Exception:
+            if not bars.shape[1] or head is not None: raise
+            return self._slice(bars, since_ms)                # exchange down: serve what is stored
+        return self._slice(self._commit(exchange_id, pair, timeframe, rows, since_ms), since_ms)
+
+    async def aload(self, exchange_id: str, pair: str, timeframe: str, since_ms: int,
+                    max_rows: int | None = None) -> pd.DataFrame:
+        """load() with a ccxt.async_support client, for concurrent fetches on one event loop."""
+        if not self.directory:
+            ex = await self.async_exchange_factory(exchange_id)
+            return to_frame(_rows(await afetch_rows(ex, pair, timeframe, since_ms, max_rows=max_rows)))
+        bars, head, tail = self._plan(exchange_id, pair, timeframe, since_ms)
+        if head is None and tail is None:
+            return self._slice(bars, since_ms)
+        try:
+            ex = await self.async_exchange_factory(exchange_id)
+            rows = await afetch_rows(ex, pair, timeframe, since_ms, until_ms=head) if head is not None else []
+            if tail is not None:
+                rows += await afetch_rows(ex, pair, timeframe, tail, max_rows=None if bars.shape[1] else max_rows)
+        except Exception:
+            if not bars.shape[1] or head is not None: raise
+            return self._slice(bars, since_ms)
+        return self._slice(self._commit(exchange_id, pair, timeframe, rows, since_ms), since_ms)
+
+    def info(self) -> List[dict]:
+        out = []
+        if not self.directory or not os.path.isdir(self.directory): return out
+        for exchange_id in sorted(os.listdir(self.directory)):
+            for name in sorted(os.listdir(os.path.join(self.directory, exchange_id))):
+                bars, meta, nseg = self._read_dir(os.path.join(self.directory, exchange_id, name))
+                if not meta: continue
+                out.append({"exchange": exchange_id, "key": name, "segments": nseg, "bars": int(bars.shape[1]),
+                            "first": int(bars[0, 0]) if bars.shape[1] else None,
+                            "last": int(bars[0, -1]) if bars.shape[1] else None})
+        return out
+
+STORE = BarStore()
+
+def ccxt_bars(exchange_id: str, pair: str, timeframe: str, since_ms: int, max_rows: int | None = None) -> pd.DataFrame:
+    """OHLCV indexed by bar open time (UTC) from since_ms on, through the shared STORE."""
+    return STORE.load(exchange_id, pair, timeframe, since_ms, max_rows)
@@ -1,30 +1,34 @@
-import time, ccxt, pandas as pd, requests
+import time, pandas as pd
+from engine.profiling import stage
+from services.data.bar_store import STORE, ccxt_bars
+from services.data.aio import DEFAULT_CONCURRENCY, bounded_gather, run_sync
+from services.data.http_client import aget_json, get_json
 from datetime import datetime, timedelta, timezone
 
 SYMBOL_TO_CG = {"BTC":"bitcoin","ETH":"ethereum","SOL":"solana"}
 
 def ccxt_ohlcv(exchange_id="binanceus", pair="BTC/USDT", timeframe="1d", since_days=540):
-    ex = getattr(ccxt, exchange_id)()
     since = int((datetime.now(timezone.utc) - timedelta(days=since_days)).timestamp() * 1000)
-    rows = []
-    while True:
-        batch = ex.fetch_ohlcv(pair, timeframe=timeframe, since=since, limit=1000)
-        if not batch: break
-        rows += batch
-        since = batch[-1][0] + 1
-        if len(batch) < 1000: break
-        time.sleep(ex.rateLimit/1000)
-    df = pd.DataFrame(rows, columns=["t","open","high","low","close","volume"]).set_index("t")
-    df.index = pd.to_datetime(df.index, unit="ms", utc=True)
-    return df
+    return ccxt_bars(exchange_id, pair, timeframe, since)
 
-def coingecko_ohlcv(gecko_id: str, days=540):
-    base = "https://api.coingecko.com/api/v3"
+async def ccxt_ohlcv_async(exchange_id="binanceus", pair="BTC/USDT", timeframe="1d", since_days=540):
+    since = int((datetime.now(timezone.utc) - timedelta(days=since_days)).timestamp() * 1000)
+    return await STORE.aload(exchange_id, pair, timeframe, since)
+
+def _coingecko_request(gecko_id: str, days: int):
     end = int(time.time()); start = end - days*24*3600
-    url = f"{base}/coins/{gecko_id}/market_chart/range"
-    r = requests.get(url, params={"vs_currency":"usd","from":start,"to":end}, timeout=20)
-    r.raise_for_status()
-    j = r.json()
+    return (f"https://api.coingecko.com/api/v3/coins/{gecko_id}/market_chart/range",
+            {"vs_currency":"usd","from":start,"to":end})
+
+def coingecko_ohlcv(gecko_id: str, days=540):
+    url, params = _coingecko_request(gecko_id, days)
+    return _coingecko_frame(get_json(url, params, timeout=20))
+
+async def coingecko_ohlcv_async(gecko_id: str, days=540):
+    url, params = _coingecko_request(gecko_id, days)
+    return _coingecko_frame(await aget_json(url, params, timeout=20))
+
+def _coingecko_frame(j: dict) -> pd.DataFrame:
     dfp = pd.DataFrame(j["prices"], columns=["t","close"]).set_index("t")
     dfv = pd.DataFrame(j["total_volumes"], columns=["t","volume"]).set_index("t")
     df = pd.concat([dfp, dfv], axis=1)
@@ -33,20 +37,26 @@ def coingecko_ohlcv(gecko_id: str, days=540):
     df["open"] = df["close"]; df["high"] = df["close"]; df["low"] = df["close"]
     return df[["open","high","low","close","volume"]]
 
+async def load_universe_async(universe: list[str], since_days=540, exchange_id="binanceus",
+                              concurrency: int = DEFAULT_CONCURRENCY) -> dict[str, pd.DataFrame]:
+    """Every symbol fetched concurrently on the shared rate-limited async client, at most
+    `concurrency` at a time; CoinGecko is the per-symbol fallback as in load_universe."""
+    async def one(sym):
+        with stage(f"fetch_ohlcv:{sym}"):
+            try:
+                df = await ccxt_ohlcv_async(exchange_id, f"{sym}/USDT", "1d", since_days)
+                print(f"✅ Got {sym} from CCXT")
+                return df
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                print(f"❌ CCXT failed for {sym}: {e}")
+                return await coingecko_ohlcv_async(SYMBOL_TO_CG[sym], since_days)
+    frames = await bounded_gather((one(sym) for sym in universe), concurrency)
+    return dict(zip(universe, frames))
+
 def load_universe(universe: list[str], since_days=540) -> dict[str, pd.DataFrame]:
-    out = {}
-    for sym in universe:
-        pair = f"{sym}/USDT"
-        try:
-            df = ccxt_ohlcv("binanceus", pair, "1d", since_days)
-            print(f"✅ Got {sym} from CCXT")
-            out[sym] = df
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(f"❌ CCXT failed for {sym}: {e}")
-            out[sym] = coingecko_ohlcv(SYMBOL_TO_CG[sym], since_days)
-    return out
+    return run_sync(load_universe_async(universe, since_days))
 
 
 def top_tickers_from_coingecko(vs_currency: str = "usd", per_page: int = 50) -> list[str]:
@@ -56,9 +66,7 @@ def top_tickers_from_coingecko(vs_currency: str = "usd", per_page: int = 50) ->
     base = "https://api.coingecko.com/api/v3"
     url = f"{base}/coins/markets"
     try:
-        r = requests.get(url, params={"vs_currency": vs_currency, "order": "volume_desc", "per_page": per_page, "page": 1}, timeout=10)
-        r.raise_for_status()
-        j = r.json()
+        j = get_json(url, params={"vs_currency": vs_currency, "order": "volume_desc", "per_page": per_page, "page": 1}, timeout=10)
         syms = []
         for item in j:
             s = item.get("symbol")
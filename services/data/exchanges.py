@@ -0,0 +1,143 @@
+# exchanges.py
+# Process-wide ccxt clients. exchange(id) returns one long-lived sync client per
+# exchange id and async_exchange(id) one ccxt.async_support client per (id, event
+# loop), so HTTP connection pools, rate-limit throttles and loaded markets survive
+# across calls. Market metadata (load_markets) is kept on disk for MARKETS_TTL_S
+# seconds (default 6h), so a cold worker starts without refetching market lists.
+# Every HTTP request a client makes is counted and timed; stats() reports them
+# per exchange id.
+#
+# EXCHANGE_CACHE_DIR overrides the metadata directory (default .cache/exchanges);
+# set it to an empty string to always load markets from the exchange.
+from __future__ import annotations
+import asyncio, functools, json, os, tempfile, threading, time
+from services.data.aio import register_closer
+
+MARKETS_TTL_S = float(os.getenv("MARKETS_TTL_S", 6*3600))
+CACHE_DIR = os.getenv("EXCHANGE_CACHE_DIR", os.path.join(".cache", "exchanges")) or None
+
+_clients: dict = {}                   # exchange id -> sync client
+_create_locks: dict = {}              # exchange id -> threading.Lock guarding creation
+_async_clients: dict = {}             # (exchange id, loop) -> async client
+_async_locks: dict = {}               # (exchange id, loop) -> asyncio.Lock guarding creation
+_lock = threading.Lock()
+_stats: dict = {}                     # exchange id -> [requests, errors, total_s, max_s]
+
+# ---------- Request metrics ----------
+def _record(exchange_id: str, dt: float, ok: bool):
+    with _lock:
+        st = _stats.setdefault(exchange_id, [0, 0, 0.0, 0.0])
+        st[0] += 1; st[1] += not ok; st[2] += dt; st[3] = max(st[3], dt)
+
+def _instrument(ex, exchange_id: str):
+    # ccxt routes every HTTP call through self.fetch(url, method, headers, body)
+    fetch = ex.fetch
+    if asyncio.iscoroutinefunction(fetch):
+        @functools.wraps(fetch)
+        async def timed_fetch(*args, **kwargs):
+            t, ok = time.perf_counter(), False
+            try:
+                out = await fetch(*args, **kwargs); ok = True
+                return out
+            finally:
+                _record(exchange_id, time.perf_counter() - t, ok)
+    else:
+        @functools.wraps(fetch)
+        def timed_fetch(*args, **kwargs):
+            t, ok = time.perf_counter(), False
+            try:
+                out = fetch(*args, **kwargs); ok = True
+                return out
+            finally:
+                _record(exchange_id, time.perf_counter() - t, ok)
+    ex.fetch = timed_fetch
+    return ex
+
+def stats() -> dict:
+    """{exchange id: {requests, errors, total_ms, avg_ms, max_ms}}."""
+    with _lock:
+        return {k: {"requests": n, "errors": err, "total_ms": round(tot*1e3, 3),
+                    "avg_ms": round(tot*1e3 / n, 3) if n else 0.0, "max_ms": round(mx*1e3, 3)}
+                for k, (n, err, tot, mx) in _stats.items()}
+
+def reset_stats():
+    with _lock: _stats.clear()
+
+# ---------- Market metadata ----------
+def _markets_path(exchange_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"{exchange_id}_markets.json")
+
+def _read_markets(exchange_id: str) -> dict | None:
+    if not CACHE_DIR: return None
+    path = _markets_path(exchange_id)
+    try:
+        if time.time() - os.path.getmtime(path) > MARKETS_TTL_S: return None
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_markets(ex, exchange_id: str):
+    if not CACHE_DIR or not ex.markets: return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"markets": ex.markets, "currencies": ex.currencies}, f, default=str)
+        os.replace(tmp, _markets_path(exchange_id))
+    except OSError:
+        pass
+
+def _seed_markets(ex, exchange_id: str) -> bool:
+    cached = _read_markets(exchange_id)
+    if cached is None: return False
+    ex.set_markets(cached["markets"], cached.get("currencies"))
+    return True
+
+# ---------- Clients ----------
+def exchange(exchange_id: str):
+    """Shared sync ccxt client for exchange_id, with markets loaded."""
+    with _lock:
+        ex = _clients.get(exchange_id)
+        if ex is not None: return ex
+        create = _create_locks.setdefault(exchange_id, threading.Lock())
+    with create:                              # concurrent first callers wait for one client
+        with _lock:
+            if exchange_id in _clients: return _clients[exchange_id]
+        import ccxt
+        ex = _instrument(getattr(ccxt, exchange_id)({"enableRateLimit": True}), exchange_id)
+        if not _seed_markets(ex, exchange_id):
+            ex.load_markets(); _write_markets(ex, exchange_id)
+        with _lock: _clients[exchange_id] = ex
+    return ex
+
+async def async_exchange(exchange_id: str):
+    """Shared ccxt.async_support client for exchange_id on the running event loop."""
+    key = (exchange_id, asyncio.get_running_loop())
+    with _lock:
+        ex = _async_clients.get(key)
+        if ex is not None: return ex
+        create = _async_locks.setdefault(key, asyncio.Lock())
+    async with create:                        # concurrent first callers wait for one client
+        if key in _async_clients: return _async_clients[key]
+        import ccxt.async_support as accxt
+        ex = _instrument(getattr(accxt, exchange_id)({"enableRateLimit": True}), exchange_id)
+        if not _seed_markets(ex, exchange_id):
+            try:
+                await ex.load_markets()
+            except Exception:
+                await ex.close(); raise
+            _write_markets(ex, exchange_id)
+        with _lock: _async_clients[key] = ex
+    return ex
+
+@register_closer
+async def aclose(loop=None):
+    """Close the async clients bound to `loop` (default: the running one)."""
+    loop = loop or asyncio.get_running_loop()
+    with _lock:
+        mine = [k for k in _async_clients if k[1] is loop]
+        clients = [_async_clients.pop(k) for k in mine]
+        for k in mine: _async_locks.pop(k, None)
+    for ex in clients:
+        await ex.close()
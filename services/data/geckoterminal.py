@@ -1,6 +1,6 @@
-import requests
 import os
 from typing import List, Dict, Any, Optional
+from services.data.http_client import get_json
 
 BASE = os.getenv("GECKOTERMINAL_API", "https://api.geckoterminal.com/api/v2")
 API_VERSION_HEADER = "application/json;version=20230302"
@@ -8,9 +8,7 @@ API_VERSION_HEADER = "application/json;version=20230302"
 
 def _get(url: str, params: dict | None = None) -> dict:
     headers = {"Accept": API_VERSION_HEADER}
-    resp = requests.get(url, params=params or {}, headers=headers, timeout=10)
-    resp.raise_for_status()
-    return resp.json()
+    return get_json(url, params=params or {}, headers=headers, timeout=10)
 
 
 def trending_pools(duration: str = "5m", page: int = 1, include: str = "base_token,quote_token") -> List[Dict[str, Any]]:
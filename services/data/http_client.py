@@ -0,0 +1,126 @@
+# http_client.py
+# One HTTP layer for the data providers (CoinGecko, GeckoTerminal, CryptoPanic).
+#  - a keep-alive session per host: requests.Session for sync callers, an aiohttp
+#    session per (host, event loop) for the async data path (services.data.aio);
+#  - HTTP_POOL_SIZE connections per host (default 10);
+#  - up to HTTP_RETRIES retries (default 3) on connection errors, 429 and 5xx, with
+#    jittered exponential backoff starting at HTTP_BACKOFF_S (default 0.5s); a
+#    Retry-After header is honoured (capped at HTTP_BACKOFF_MAX_S, default 30s);
+#  - gzip/deflate responses;
+#  - per-host request counts, retries, errors and latency in stats().
+from __future__ import annotations
+import asyncio, os, random, threading, time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from services.data.aio import register_closer
+
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+BACKOFF_S = float(os.getenv("HTTP_BACKOFF_S", 0.5))
+BACKOFF_MAX_S = float(os.getenv("HTTP_BACKOFF_MAX_S", 30))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+HEADERS = {"Accept-Encoding": "gzip, deflate", "Accept": "application/json"}
+
+_sessions: dict = {}                  # host -> requests.Session
+_async_sessions: dict = {}            # (host, loop) -> aiohttp.ClientSession
+_lock = threading.Lock()
+_stats: dict = {}                     # host -> [requests, retries, errors, total_s, max_s]
+
+# ---------- Metrics ----------
+def _record(host: str, dt: float, ok: bool, retries: int):
+    with _lock:
+        st = _stats.setdefault(host, [0, 0, 0, 0.0, 0.0])
+        st[0] += 1; st[1] += retries; st[2] += not ok; st[3] += dt; st[4] = max(st[4], dt)
+
+def stats() -> dict:
+    """{host: {requests, retries, errors, total_ms, avg_ms, max_ms}}; one request includes its retries."""
+    with _lock:
+        return {h: {"requests": n, "retries": rt, "errors": err, "total_ms": round(tot*1e3, 3),
+                    "avg_ms": round(tot*1e3 / n, 3) if n else 0.0, "max_ms": round(mx*1e3, 3)}
+                for h, (n, rt, err, tot, mx) in _stats.items()}
+
+def reset_stats():
+    with _lock: _stats.clear()
+
+def _backoff(attempt: int, retry_after: str | None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_S)
+        except ValueError:
+            pass
+    return min(BACKOFF_S * 2**attempt, BACKOFF_MAX_S) * random.uniform(0.5, 1.5)
+
+# ---------- Sync ----------
+def session(host: str) -> requests.Session:
+    with _lock:
+        s = _sessions.get(host)
+        if s is None:
+            s = _sessions[host] = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            s.mount("https://", adapter); s.mount("http://", adapter)
+            s.headers.update(HEADERS)
+        return s
+
+def get(url: str, params: dict | None = None, headers: dict | None = None, timeout: float = 20) -> requests.Response:
+    """GET through the host's pooled session, retrying transient failures; raises on a final HTTP error."""
+    host = urlsplit(url).netloc
+    s, t, attempt = session(host), time.perf_counter(), 0
+    while True:
+        try:
+            r = s.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= RETRIES:
+                _record(host, time.perf_counter() - t, False, attempt); raise
+            time.sleep(_backoff(attempt, None)); attempt += 1
+            continue
+        if r.status_code in RETRY_STATUS and attempt < RETRIES:
+            time.sleep(_backoff(attempt, r.headers.get("Retry-After"))); attempt += 1
+            continue
+        _record(host, time.perf_counter() - t, r.ok, attempt)
+        r.raise_for_status()
+        return r
+
+def get_json(url: str, params: dict | None = None, headers: dict | None = None, timeout: float = 20):
+    return get(url, params, headers, timeout).json()
+
+# ---------- Async ----------
+def _async_session(host: str):
+    import aiohttp
+    key = (host, asyncio.get_running_loop())
+    with _lock:
+        s = _async_sessions.get(key)
+        if s is None or s.closed:
+            s = _async_sessions[key] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=POOL_SIZE), headers=HEADERS)
+        return s
+
+async def aget_json(url: str, params: dict | None = None, headers: dict | None = None, timeout: float = 20):
+    """get_json() for coroutines on the same host pool, retry policy and metrics."""
+    import aiohttp
+    host = urlsplit(url).netloc
+    s, t, attempt = _async_session(host), time.perf_counter(), 0
+    while True:
+        try:
+            async with s.get(url, params=params, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                if r.status in RETRY_STATUS and attempt < RETRIES:
+                    wait = _backoff(attempt, r.headers.get("Retry-After"))
+                else:
+                    _record(host, time.perf_counter() - t, r.status < 400, attempt)
+                    r.raise_for_status()
+                    return await r.json(content_type=None)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt >= RETRIES:
+                _record(host, time.perf_counter() - t, False, attempt); raise
+            wait = _backoff(attempt, None)
+        await asyncio.sleep(wait); attempt += 1
+
+@register_closer
+async def aclose(loop=None):
+    """Close the aiohttp sessions bound to `loop` (default: the running one)."""
+    loop = loop or asyncio.get_running_loop()
+    with _lock:
+        mine = [k for k in _async_sessions if k[1] is loop]
+        sessions = [_async_sessions.pop(k) for k in mine]
+    for s in sessions:
+        await s.close()
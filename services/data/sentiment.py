@@ -97,20 +97,21 @@
 #     return out
 
 
-import os, requests, pandas as pd
+import os, pandas as pd
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from engine.profiling import timed
+from services.data.http_client import get_json
 
 CP_API = "https://cryptopanic.com/api/developer/v2/posts/"
 
+@timed("fetch_headlines")
 def fetch_headlines(auth_token: str | None) -> pd.DataFrame:
     if not auth_token:
         return pd.DataFrame(columns=["time","title","assets"])
-    r = requests.get(CP_API, params={
+    items = get_json(CP_API, params={
         "auth_token": auth_token, "kind": "news",
         "filter": "rising|hot|bullish|bearish", "public": "true"
-    }, timeout=20)
-    r.raise_for_status()
-    items = r.json().get("results", [])
+    }, timeout=20).get("results", [])
     rows = []
     for it in items:
         ts = pd.to_datetime(it["published_at"], utc=True)
@@ -124,6 +125,7 @@ def fetch_headlines(auth_token: str | None) -> pd.DataFrame:
         rows.append({"time": ts, "title": title, "assets": assets})
     return pd.DataFrame(rows)
 
+@timed("vader_scoring")
 def rolling_sentiment(df_news: pd.DataFrame) -> dict[str, pd.Series]:
     sid = SentimentIntensityAnalyzer()
     rows = []
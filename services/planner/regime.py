@@ -1,5 +1,6 @@
+import numpy as np
 import pandas as pd
-from engine.indicators import ema, adx, macd, bollinger, donchian_high, donchian_low, atr
+from engine.indicators import ema, adx, macd, bollinger, donchian_high, donchian_low, atr, _memo
 
 def classify_regime(df: pd.DataFrame) -> str:
     c,h,l,v = df["close"], df["high"], df["low"], df["volume"]
@@ -12,11 +13,16 @@ def classify_regime(df: pd.DataFrame) -> str:
     adx_rising = (adx14.diff().tail(5) > 0).sum() >= 3
     vol_surge  = v.iloc[-1] > 1.5 * v.rolling(20).mean().iloc[-1]
 
-    cond_range     = (adx14.iloc[-1] < 20) and (bw.iloc[-1] < bw.dropna().quantile(0.30))
-    cond_trend_up  = (c.iloc[-1] > ema50.iloc[-1] > ema200.iloc[-1]) and (adx14.iloc[-1] >= 20) and (macd_line.iloc[-1] > 0)
-    cond_trend_dn  = (c.iloc[-1] < ema50.iloc[-1] < ema200.iloc[-1]) and (adx14.iloc[-1] >= 20) and (macd_line.iloc[-1] < 0)
-    cond_break_up  = (c.iloc[-1] > d_hi.iloc[-1]) and vol_surge and adx_rising
-    cond_break_dn  = (c.iloc[-1] < d_lo.iloc[-1]) and vol_surge and adx_rising
+    return regime_from(c.iloc[-1], adx14.iloc[-1], adx_rising, vol_surge, bw.iloc[-1], bw.dropna().quantile(0.30),
+                       d_hi.iloc[-1], d_lo.iloc[-1], ema50.iloc[-1], ema200.iloc[-1], macd_line.iloc[-1])
+
+def regime_from(close, adx14, adx_rising, vol_surge, bw, bw_q30, d_hi, d_lo, ema50, ema200, macd_line) -> str:
+    """Label one bar from its last-bar indicator values (shared with engine.vectorized)."""
+    cond_range     = (adx14 < 20) and (bw < bw_q30)
+    cond_trend_up  = (close > ema50 > ema200) and (adx14 >= 20) and (macd_line > 0)
+    cond_trend_dn  = (close < ema50 < ema200) and (adx14 >= 20) and (macd_line < 0)
+    cond_break_up  = (close > d_hi) and vol_surge and adx_rising
+    cond_break_dn  = (close < d_lo) and vol_surge and adx_rising
 
     if cond_break_up: return "breakout_up"
     if cond_break_dn: return "breakout_down"
@@ -25,10 +31,44 @@ def classify_regime(df: pd.DataFrame) -> str:
     if cond_range:    return "range"
     return "other"
 
+# ---------- Whole history ----------
+def classify_regime_series(df: pd.DataFrame, quantile_window: int | None = None) -> pd.Series:
+    """Regime label for every bar in one pass. With quantile_window=None the Bollinger
+    bandwidth threshold is an expanding 30% quantile, so the label at t equals
+    classify_regime(df.loc[:t]); an int uses a rolling quantile over that many bars."""
+    return _regime_series(df["close"], df["high"], df["low"], df["volume"], quantile_window)
+
+@_memo
+def _regime_series(c, h, l, v, quantile_window):
+    adx14 = adx(h,l,c,14)
+    _, _, _, bw, _ = bollinger(c,20,2)
+    d_hi, d_lo = donchian_high(h,20), donchian_low(l,20)
+    ema50, ema200 = ema(c,50), ema(c,200)
+    macd_line, _, _ = macd(c)
+
+    adx_rising = (adx14.diff() > 0).rolling(5, min_periods=1).sum() >= 3
+    vol_surge  = v > 1.5 * v.rolling(20).mean()
+    q = bw.expanding() if quantile_window is None else bw.rolling(quantile_window, min_periods=1)
+    labels = regime_labels(c, adx14, adx_rising, vol_surge, bw, q.quantile(0.30),
+                           d_hi, d_lo, ema50, ema200, macd_line)
+    return pd.Series(labels, index=c.index, name="regime")
+
+def regime_labels(close, adx14, adx_rising, vol_surge, bw, bw_q30, d_hi, d_lo, ema50, ema200, macd_line) -> np.ndarray:
+    """Array version of regime_from (same precedence; NaN comparisons are False)."""
+    a = lambda x: np.asarray(x, dtype=float)
+    close, adx14, bw, bw_q30, d_hi, d_lo, ema50, ema200, macd_line = map(
+        a, (close, adx14, bw, bw_q30, d_hi, d_lo, ema50, ema200, macd_line))
+    adx_rising, vol_surge = np.asarray(adx_rising, dtype=bool), np.asarray(vol_surge, dtype=bool)
+    conds = [(close > d_hi) & vol_surge & adx_rising,
+             (close < d_lo) & vol_surge & adx_rising,
+             (close > ema50) & (ema50 > ema200) & (adx14 >= 20) & (macd_line > 0),
+             (close < ema50) & (ema50 < ema200) & (adx14 >= 20) & (macd_line < 0),
+             (adx14 < 20) & (bw < bw_q30)]
+    return np.select(conds, ["breakout_up", "breakout_down", "trend_up", "trend_down", "range"], "other").astype(object)
+
 def map_regime_to_template(regime: str) -> str:
     if regime == "trend_up":      return "trend_follow"
     if regime == "range":         return "mean_revert"
     if regime == "breakout_up":   return "breakout_up"
     if regime in ("other","trend_down","breakout_down"): return "support_bounce"
     return "trend_follow"
-
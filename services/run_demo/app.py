@@ -5,12 +5,16 @@ from pprint import pprint
 from services.planner.plan_analyzer import build_plan_json_from_text, analyze_features, build_plan_with_gemini, classify_intent, parse_scan_query
 from services.data.data_layer import top_tickers_from_coingecko
 from services.data.data_layer import load_universe
+from services.data import exchanges, http_client
 from trade_patterns.signals.scanner import scan
 from trade_patterns.signals.render_helpers import render_cards_to_base64
 from trade_patterns.data.ohlcv_intraday import load_ohlcv as tp_load_ohlcv
 from services.data.sentiment import fetch_headlines, rolling_sentiment
 from engine.engine import Plan
 from engine.backtest import run_backtest
+from engine.result_cache import ResultCache, TTLCache, backtest_key, data_version
+from engine.profiling import profile, stage
+from services.planner.regime import classify_regime_series
 from dotenv import load_dotenv
 import pandas as pd
 from fastapi.middleware.cors import CORSMiddleware
@@ -56,18 +60,7 @@ class BacktestReq(BaseModel):
 
 
 def to_plan_obj(pj: dict) -> Plan:
-    return Plan(
-        regime=pj["regime"],
-        direction_bias=pj.get("direction_bias", "neutral"),
-        universe=pj["universe_list"],
-        gates=pj["gates"],
-        custom_rules=pj.get("custom_rules", []),
-        weighting=pj["weighting"],
-        rebalance=pj["rebalance"],
-        risk=pj["risk"],
-        execution=pj["execution"],
-        sentiment_cfg=pj.get("sentiment_cfg", {}),
-    )
+    return Plan.from_dict(pj)
 
 
 @app.post("/plan")
@@ -160,18 +153,74 @@ def get_headlines():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# regime series per (symbol, days, quantile_window), for REGIME_TTL_S; the newest
+# REGIME_MAX_ENTRIES keys are kept
+REGIME_TTL_S = 3600
+REGIME_MAX_ENTRIES = int(os.getenv("REGIME_CACHE_SIZE", 256))
+_REGIME_CACHE = TTLCache(REGIME_MAX_ENTRIES, REGIME_TTL_S)
+
+@app.get("/regime/{symbol}")
+def regime(symbol: str, days: int = 540, quantile_window: int | None = None):
+    try:
+        key = (symbol.upper(), days, quantile_window)
+        found, labels = _REGIME_CACHE.get(key)
+        if not found:
+            df = load_universe([key[0]], since_days=days)[key[0]]
+            labels = classify_regime_series(df, quantile_window)
+            _REGIME_CACHE.put(key, labels)
+        return {"symbol": key[0], "current": labels.iloc[-1] if len(labels) else None,
+                "series": [{"t": str(t), "regime": r} for t, r in labels.items()]}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/exchanges/stats")
+def exchange_stats():
+    # per-exchange request counts and latency of the pooled ccxt clients
+    return exchanges.stats()
+
+@app.get("/http/stats")
+def http_stats():
+    # per-host request counts, retries and latency of the provider HTTP sessions
+    return http_client.stats()
+
+
+# /backtest: inputs are fetched on every request (OHLCV comes from the local bar
+# store, services.data.bar_store), so the data version below always reflects the
+# latest bar; results are cached by plan hash + start/end + data version (engine.result_cache)
+_RESULTS = ResultCache()
+
+def _backtest_inputs(assets: list, days: int, cp_key: str | None):
+    ohlcv = load_universe(assets, since_days=days)
+    cp = fetch_headlines(auth_token if cp_key is None else cp_key)
+    sent = rolling_sentiment(cp) if isinstance(cp, pd.DataFrame) and not cp.empty else {}
+    return ohlcv, sent
+
+
 @app.post("/backtest")
 def backtest(req: BacktestReq):
+    # debug=True adds a per-stage timing breakdown (engine.profiling) to the response
+    with profile(req.debug) as prof:
+        out = _backtest(req)
+    if prof is not None:
+        out["profile"] = prof.report()
+    return out
+
+def _backtest(req: BacktestReq) -> dict:
     try:
         meta = analyze_features(req.plan)
         assets = meta["assets"]
         days = meta["lookback_days"]
-        ohlcv = load_universe(assets, since_days=days)
-        cp = fetch_headlines(auth_token if req.cp_key is None else req.cp_key)
-        sent = rolling_sentiment(cp) if isinstance(cp, pd.DataFrame) and not cp.empty else {}
+        ohlcv, sent = _backtest_inputs(assets, days, req.cp_key)
+
+        key = backtest_key(req.plan, req.start, req.end, data_version(ohlcv, sent))
+        found, result = _RESULTS.get(key)
+        if found:
+            return {**result, "cached": True}
 
         plan_obj = to_plan_obj(req.plan)
-        ec, stats = run_backtest(plan_obj, ohlcv, sent, start=req.start, end=req.end)
+        with stage("run_backtest"):
+            ec, stats = run_backtest(plan_obj, ohlcv, sent, start=req.start, end=req.end)
 
         # Handle both DataFrame and dict output for ec
         equity_curve = []
@@ -183,7 +232,10 @@ def backtest(req: BacktestReq):
             for t, v in zip(ec.index, ec["equity"]):
                 equity_curve.append({"t": str(t), "equity": float(v)})
 
-        return {"stats": stats, "equity_curve": equity_curve}
+        result = {"stats": stats, "equity_curve": equity_curve}
+        if "error" not in stats:
+            _RESULTS.put(key, result)
+        return {**result, "cached": False}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
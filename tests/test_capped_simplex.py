@@ -0,0 +1,63 @@
+# test_capped_simplex.py
+# capped_simplex must keep every weight inside [lo, hi] and sum to total whenever the
+# bounds allow it, and _cap_weights must allocate like the redistribution loop it replaced.
+import numpy as np
+import pytest
+from engine.engine import Plan, capped_simplex, _cap_weights
+
+def _plan(max_weight=0.40, hard_cap=0.50) -> Plan:
+    return Plan(regime="auto", direction_bias="neutral", universe=[], gates={}, custom_rules=[],
+                weighting={}, rebalance={}, risk={"max_weight": max_weight, "hard_cap": hard_cap},
+                execution={}, sentiment_cfg={})
+
+def _loop_weights(weights: dict, cap=0.40, hard=0.50) -> dict:
+    # the pre-water-filling _cap_weights
+    w = {k: min(v, cap) for k, v in weights.items()}
+    s = sum(w.values()); w = {k: v/s for k, v in w.items()} if s > 0 else {}
+    changed = True
+    while changed and w:
+        changed = False; over = [k for k, v in w.items() if v > hard]
+        if over:
+            changed = True; excess = sum(w[k]-hard for k in over)
+            for k in over: w[k] = hard
+            rem = [k for k in w if k not in over]; rs = sum(w[k] for k in rem)
+            for k in rem:
+                w[k] = w[k] + (w[k]/(rs+1e-9))*excess if rs > 0 else w[k]
+    s = sum(w.values())
+    return {k: v/s for k, v in w.items()} if s > 0 else {}
+
+CASES = {
+    "capped":     ({"a": 0.4, "b": 0.1, "c": 0.05}, 0.40, 0.50),
+    "ties":       ({"a": 0.9, "b": 0.9, "c": 0.3, "d": 0.3}, 0.40, 0.30),
+    "zero-score": ({"a": 0.6, "b": 0.2, "c": 0.0}, 0.40, 0.50),
+    "single":     ({"a": 0.7}, 0.40, 0.50),
+    "infeasible": ({"a": 0.5, "b": 0.3}, 0.40, 0.30),
+    "uncapped":   ({"a": 0.2, "b": 0.3, "c": 0.25}, 0.40, 0.50),
+}
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_matches_redistribution_loop(case):
+    weights, cap, hard = CASES[case]
+    got, ref = _cap_weights(_plan(cap, hard), weights), _loop_weights(weights, cap, hard)
+    assert got.keys() == ref.keys()
+    np.testing.assert_allclose([got[k] for k in ref], list(ref.values()), rtol=1e-7, atol=1e-9)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_loop_random(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 40))
+    weights = {f"A{i}": float(x) for i, x in enumerate(rng.random(n) * (rng.random(n) > 0.2))}
+    if sum(weights.values()) <= 0: weights["A0"] = 1.0
+    got, ref = _cap_weights(_plan(0.4, 0.3), weights), _loop_weights(weights, 0.4, 0.3)
+    np.testing.assert_allclose([got[k] for k in ref], list(ref.values()), rtol=1e-7, atol=1e-9)
+
+@pytest.mark.parametrize("seed", range(25))
+def test_random_bounds(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 30))
+    u = rng.random(n) + 0.01
+    lo = rng.uniform(0, 0.5 / n, n)
+    hi = rng.uniform(1.5 / n, 3.0 / n, n)
+    w = capped_simplex(u / u.sum(), lo, hi)
+    assert np.all(w >= lo - 1e-12) and np.all(w <= hi + 1e-12)
+    assert w.sum() == pytest.approx(1.0, abs=1e-12)
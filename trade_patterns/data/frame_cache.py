@@ -0,0 +1,61 @@
+# frame_cache.py
+# In-process cache of resampled OHLCV frames for load_ohlcv, keyed by
+# (exchange, symbol, timeframe). An entry stays valid until the next bar of its
+# timeframe closes (a 5m frame until the next 5-minute boundary, UTC-aligned), and
+# serves any request for at most as many bars as it was loaded with by taking the
+# tail. Total frame memory is capped (OHLCV_FRAME_CACHE_MB, default 64) with LRU
+# eviction.
+from __future__ import annotations
+import os, threading, time
+from collections import OrderedDict
+import pandas as pd
+
+def next_bar_close(step_s: int, now: float | None = None) -> float:
+    now = time.time() if now is None else now
+    return (now // step_s + 1) * step_s
+
+class FrameCache:
+    def __init__(self, max_bytes: int | None = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("OHLCV_FRAME_CACHE_MB", 64)) * 2**20)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()   # key -> (expires_at, bars, frame, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key: tuple, bars: int) -> pd.DataFrame | None:
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None or e[0] <= time.time() or e[1] < bars:
+                if e is not None and e[0] <= time.time(): self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key); self.hits += 1
+            return e[2].tail(bars)
+
+    def put(self, key: tuple, bars: int, frame: pd.DataFrame, step_s: int):
+        nbytes = int(frame.memory_usage(index=True).sum())
+        if nbytes > self.max_bytes: return
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None and old[1] > bars and old[0] > time.time():
+                return                                   # keep the longer, still valid entry
+            self._drop(key)
+            self._entries[key] = (next_bar_close(step_s), bars, frame, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        e = self._entries.pop(key, None)
+        if e is not None: self._bytes -= e[3]
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear(); self._bytes = 0; self.hits = self.misses = 0
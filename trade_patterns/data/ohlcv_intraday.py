@@ -1,5 +1,9 @@
-import time, ccxt, pandas as pd, requests
+import time, pandas as pd
 from datetime import datetime, timedelta, timezone
+from services.data.bar_store import STORE, ccxt_bars
+from services.data.aio import DEFAULT_CONCURRENCY, bounded_gather, run_sync
+from services.data.http_client import aget_json, get_json
+from .frame_cache import FrameCache
 
 #blue chips and meme coins 
 COINGECKO = {
@@ -11,35 +15,36 @@ COINGECKO = {
 
 #time frames 
 VALID_TFS = {"1m","3m","5m","15m","30m","1h","2h","4h","6h","12h","1d"}
+TF_MINUTES = {"1m":1,"3m":3,"5m":5,"15m":15,"30m":30,"1h":60,"2h":120,"4h":240,"6h":360,"12h":720,"1d":1440}
+
+# resampled frames, valid until the next bar of their timeframe closes
+FRAMES = FrameCache()
 
 def ccxt_ohlcv(symbol="BTC/USDT", exchange_id="binance", timeframe="1h", since_ms=None, limit=1500):
     assert timeframe in VALID_TFS
-    ex = getattr(ccxt, exchange_id)()
-    rows = []
     if since_ms is None:
         since_ms = int((datetime.now(timezone.utc) - timedelta(days=14)).timestamp() * 1000)
-    while True:
-        batch = ex.fetch_ohlcv(symbol, timeframe=timeframe, since=since_ms, limit=1000)
-        if not batch: break
-        rows += batch
-        since_ms = batch[-1][0] + 1
-        if len(batch) < 1000 or len(rows) >= limit: break
-        time.sleep(ex.rateLimit/1000.0)
-    df = pd.DataFrame(rows, columns=["t","open","high","low","close","volume"]).set_index("t")
-    df.index = pd.to_datetime(df.index, unit="ms", utc=True)
-    return df
+    return ccxt_bars(exchange_id, symbol, timeframe, since_ms, max_rows=limit)
 
 #coin gecko function for fallback 
-def cg_market_chart_range(symbol: str, vs="usd", start_s: int|None=None, end_s: int|None=None):
+def _cg_request(symbol: str, vs: str, start_s: int|None, end_s: int|None):
     cid = COINGECKO[symbol]
     if end_s is None:
         end_s = int(time.time())
     if start_s is None:
         start_s = end_s - 7*24*3600
-    url = f"https://api.coingecko.com/api/v3/coins/{cid}/market_chart/range"
-    r = requests.get(url, params={"vs_currency":vs,"from":start_s,"to":end_s}, timeout=30)
-    r.raise_for_status()
-    j = r.json()
+    return (f"https://api.coingecko.com/api/v3/coins/{cid}/market_chart/range",
+            {"vs_currency":vs,"from":start_s,"to":end_s})
+
+def cg_market_chart_range(symbol: str, vs="usd", start_s: int|None=None, end_s: int|None=None):
+    url, params = _cg_request(symbol, vs, start_s, end_s)
+    return _cg_frame(get_json(url, params, timeout=30))
+
+async def cg_market_chart_range_async(symbol: str, vs="usd", start_s: int|None=None, end_s: int|None=None):
+    url, params = _cg_request(symbol, vs, start_s, end_s)
+    return _cg_frame(await aget_json(url, params, timeout=30))
+
+def _cg_frame(j: dict) -> pd.DataFrame:
     dfp = pd.DataFrame(j.get("prices", []), columns=["t","close"]).set_index("t")
     dfv = pd.DataFrame(j.get("total_volumes", []), columns=["t","volume"]).set_index("t")
     df = pd.concat([dfp, dfv], axis=1)
@@ -47,23 +52,64 @@ def cg_market_chart_range(symbol: str, vs="usd", start_s: int|None=None, end_s:
     df["open"] = df["close"]; df["high"] = df["close"]; df["low"] = df["close"]
     return df[["open","high","low","close","volume"]]
 
-#our main entry point 
-def load_ohlcv(symbol: str, timeframe: str, bars: int = 720, exchange_id="binance"):
+def _lookback(timeframe: str, bars: int):
     assert timeframe in VALID_TFS
-    tf_minutes = {"1m":1,"3m":3,"5m":5,"15m":15,"30m":30,"1h":60,"2h":120,"4h":240,"6h":360,"12h":720,"1d":1440}[timeframe]
+    tf_minutes = TF_MINUTES[timeframe]
     lookback_minutes = tf_minutes * (bars + 5)
     since_ms = int((datetime.now(timezone.utc) - timedelta(minutes=lookback_minutes)).timestamp()*1000)
+    end_s = int(time.time())
+    return since_ms, end_s - lookback_minutes*60, end_s
+
+#our main entry point 
+def load_ohlcv(symbol: str, timeframe: str, bars: int = 720, exchange_id="binance"):
+    key = (exchange_id, symbol, timeframe)
+    hit = FRAMES.get(key, bars)
+    if hit is not None:
+        return hit
+    since_ms, start_s, end_s = _lookback(timeframe, bars)
     pair = f"{symbol}/USDT"
     try:
         df = ccxt_ohlcv(pair, exchange_id=exchange_id, timeframe=timeframe, since_ms=since_ms, limit=bars+50)
     except Exception:
-        end_s = int(time.time()); start_s = end_s - lookback_minutes*60
         df = cg_market_chart_range(symbol, start_s=start_s, end_s=end_s)
+    out = _resample(df, timeframe, bars)
+    FRAMES.put(key, bars, out, TF_MINUTES[timeframe]*60)
+    return out
+
+async def load_ohlcv_async(symbol: str, timeframe: str, bars: int = 720, exchange_id="binance"):
+    """load_ohlcv on the shared async exchange client and HTTP sessions."""
+    key = (exchange_id, symbol, timeframe)
+    hit = FRAMES.get(key, bars)
+    if hit is not None:
+        return hit
+    since_ms, start_s, end_s = _lookback(timeframe, bars)
+    try:
+        df = await STORE.aload(exchange_id, f"{symbol}/USDT", timeframe, since_ms, max_rows=bars+50)
+    except Exception:
+        df = await cg_market_chart_range_async(symbol, start_s=start_s, end_s=end_s)
+    out = _resample(df, timeframe, bars)
+    FRAMES.put(key, bars, out, TF_MINUTES[timeframe]*60)
+    return out
+
+async def load_many_async(symbols: list[str], timeframe: str, bars: int = 720, exchange_id="binance",
+                          concurrency: int = DEFAULT_CONCURRENCY) -> dict[str, pd.DataFrame]:
+    """{symbol: frame} fetched concurrently; a symbol that fails on both sources maps to None."""
+    async def one(sym):
+        try:
+            return await load_ohlcv_async(sym, timeframe, bars, exchange_id)
+        except Exception:
+            return None
+    frames = await bounded_gather((one(s) for s in symbols), concurrency)
+    return dict(zip(symbols, frames))
+
+def load_many(symbols: list[str], timeframe: str, bars: int = 720, exchange_id="binance") -> dict[str, pd.DataFrame]:
+    return run_sync(load_many_async(symbols, timeframe, bars, exchange_id))
 
+def _resample(df: pd.DataFrame, timeframe: str, bars: int) -> pd.DataFrame:
     # map timeframe to pandas resample rule (use offset aliases)
     rule_map = {
-        "1m": "1T", "3m": "3T", "5m": "5T", "15m": "15T", "30m": "30T",
-        "1h": "1H", "2h": "2H", "4h": "4H", "6h": "6H", "12h": "12H", "1d": "1D"
+        "1m": "1min", "3m": "3min", "5m": "5min", "15m": "15min", "30m": "30min",
+        "1h": "1h", "2h": "2h", "4h": "4h", "6h": "6h", "12h": "12h", "1d": "1D"
     }
     rule = rule_map.get(timeframe, "1D")
 
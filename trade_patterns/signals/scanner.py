@@ -3,7 +3,7 @@ from typing import List, Dict, Any, Callable
 import pandas as pd
 # from services.data.ohlcv_intraday import load_ohlcv
 # use relative import so module resolution works when running as a package
-from ..data.ohlcv_intraday import load_ohlcv
+from ..data.ohlcv_intraday import load_many
 from .pivots import recent_pivots
 from . import patterns as P
 
@@ -90,9 +90,12 @@ def scan(symbols: List[str], tf: str, patterns: List[str],
          sensitivity: float = 1.0) -> Dict[str, Any]:
     cards: List[Dict[str, Any]] = []
 
+    # fetch every symbol concurrently up front; failed symbols come back as None
+    frames = load_many(list(symbols), tf, bars=bars)
+
     for sym in symbols:
-        # load data for symbol; defensive checks for missing/empty frames
-        df = load_ohlcv(sym, timeframe=tf, bars=bars)
+        # defensive checks for missing/empty frames
+        df = frames.get(sym)
         if df is None or df.empty:
             continue
         if len(df) < 50: